@@ -0,0 +1,39 @@
+"""Núcleo de conversão XTE ⇄ Excel da AM Consultoria, independente da interface Streamlit.
+
+Os nomes abaixo são importados sob demanda: `import amconsultoria` não carrega
+pandas, pyarrow nem Streamlit até que uma das funções seja usada.
+"""
+
+import importlib
+
+_EXPORTADOS = {
+    "parse_xte": "amconsultoria.parser_xte",
+    "iterar_guias_xte": "amconsultoria.parser_xte",
+    "gerar_xte_do_excel": "amconsultoria.gerador_xte",
+    "gerar_xte_em_diretorio": "amconsultoria.gerador_xte",
+    "gerar_xte_em_zips": "amconsultoria.gerador_xte",
+    "ler_planilha_por_origem": "amconsultoria.gerador_xte",
+    "ler_xtes_em_paralelo": "amconsultoria.ingestao",
+    "CacheParquet": "amconsultoria.cache_parquet",
+    "ConsultaConsolidada": "amconsultoria.consulta",
+    "concatenar": "amconsultoria.esquema",
+    "COLUNAS_FINAIS": "amconsultoria.esquema",
+    "exportar_consolidado": "amconsultoria.exportacao",
+    "verificar_hash_xte": "amconsultoria.hash_xte",
+    "validar_xte": "amconsultoria.validacao_xsd",
+}
+
+__all__ = list(_EXPORTADOS)
+
+
+def __getattr__(nome):
+    modulo = _EXPORTADOS.get(nome)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(importlib.import_module(modulo), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,5 @@
+import sys
+
+from amconsultoria.cli import main
+
+sys.exit(main())
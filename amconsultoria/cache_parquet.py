@@ -0,0 +1,107 @@
+import hashlib
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from amconsultoria.esquema import definir_origem
+from amconsultoria.parser_xte import VERSAO_PARSER
+
+LIMITE_PADRAO_MB = 2048
+
+
+def diretorio_padrao():
+    return os.environ.get("XTE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "amconsultoria", "xte")
+
+
+def chave_do_conteudo(conteudo):
+    """SHA-256 dos bytes do arquivo junto com a versão do parser."""
+    digest = hashlib.sha256(conteudo).hexdigest()
+    return f"{digest}-v{VERSAO_PARSER}"
+
+
+def chave_do_stream(f, tamanho_bloco=1 << 20):
+    """Mesma chave de `chave_do_conteudo`, lendo um stream binário em blocos."""
+    sha256 = hashlib.sha256()
+    for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+        sha256.update(bloco)
+    return f"{sha256.hexdigest()}-v{VERSAO_PARSER}"
+
+
+def chave_do_caminho(caminho, tamanho_bloco=1 << 20):
+    with open(caminho, "rb") as f:
+        return chave_do_stream(f, tamanho_bloco)
+
+
+class CacheParquet:
+    """Cache em disco dos DataFrames lidos de arquivos .xte, endereçado pelo conteúdo.
+
+    Cada entrada é um arquivo Parquet `<sha256>-v<versão>.parquet`. Acertos são lidos
+    com memory map e renovam a data de uso do arquivo; ao gravar, as entradas usadas
+    há mais tempo são removidas até o total caber em `limite_bytes`.
+    """
+
+    def __init__(self, diretorio=None, limite_bytes=None):
+        self.diretorio = diretorio or diretorio_padrao()
+        if limite_bytes is None:
+            limite_bytes = int(os.environ.get("XTE_CACHE_MAX_MB", LIMITE_PADRAO_MB)) * 1024 * 1024
+        self.limite_bytes = limite_bytes
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.parquet")
+
+    def ler(self, chave, nome=None):
+        """Devolve o DataFrame guardado para `chave` ou None. `nome` substitui o Nome da Origem."""
+        caminho = self._caminho(chave)
+        try:
+            tabela = pq.read_table(caminho, memory_map=True)
+            os.utime(caminho)
+        except (FileNotFoundError, pa.ArrowInvalid, OSError):
+            return None
+        df = tabela.to_pandas()
+        if nome is not None:
+            definir_origem(df, nome)
+        return df
+
+    def salvar(self, chave, df):
+        destino = self._caminho(chave)
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        os.close(descritor)
+        try:
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporario)
+            os.replace(temporario, destino)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        self.liberar_espaco()
+
+    def liberar_espaco(self):
+        entradas = []
+        total = 0
+        for entrada in os.scandir(self.diretorio):
+            if not entrada.name.endswith(".parquet"):
+                continue
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            entradas.append((info.st_mtime, info.st_size, entrada.path))
+            total += info.st_size
+
+        # Remove primeiro as entradas usadas há mais tempo (LRU pela data de modificação)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+
+    def limpar(self):
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith(".parquet"):
+                os.remove(entrada.path)
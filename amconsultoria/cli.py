@@ -0,0 +1,204 @@
+"""Linha de comando para rodar as conversões sem a interface (ex.: lotes noturnos no cron).
+
+    python -m amconsultoria xte2tab entrada/*.xte -o saida/ --formatos xlsx,csv
+    python -m amconsultoria tab2xte planilhas/ -o xte/ --extensao ambas --incremental
+    python -m amconsultoria verificar xte/
+    python -m amconsultoria validar xte/ --xsd schemas/tissMonitoramentoV1_04_01.xsd
+
+Entradas podem ser arquivos, diretórios (percorridos recursivamente) ou globs.
+Os módulos pesados (pandas, pyarrow) só são importados dentro de cada comando.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+EXTENSOES_XTE = (".xte", ".xml")
+EXTENSOES_LOTE = EXTENSOES_XTE + (".zip",)
+EXTENSOES_PLANILHA = (".xlsx", ".csv")
+FORMATOS = ("xlsx", "csv", "parquet", "arrow")
+LIMITE_AVISOS = 20  # problemas da planilha listados no stderr pelo tab2xte
+
+
+def _log(mensagem):
+    print(mensagem, file=sys.stderr, flush=True)
+
+
+def expandir_entradas(entradas, extensoes):
+    """Resolve arquivos, diretórios e globs em uma lista sem repetições, na ordem dada."""
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            encontrados = []
+            for raiz, _, arquivos in os.walk(entrada):
+                encontrados += [os.path.join(raiz, a) for a in arquivos if a.lower().endswith(extensoes)]
+            caminhos += sorted(encontrados)
+        elif glob.has_magic(entrada):
+            caminhos += sorted(c for c in glob.glob(entrada, recursive=True)
+                               if os.path.isfile(c) and c.lower().endswith(extensoes))
+        elif os.path.isfile(entrada):
+            caminhos.append(entrada)
+        else:
+            raise FileNotFoundError(f"Entrada não encontrada: {entrada}")
+    vistos = set()
+    unicos = []
+    for caminho in caminhos:
+        chave = os.path.realpath(caminho)
+        if chave not in vistos:
+            vistos.add(chave)
+            unicos.append(caminho)
+    return unicos
+
+
+def _formatos(texto):
+    formatos = tuple(f.strip().lower() for f in texto.split(",") if f.strip())
+    invalidos = [f for f in formatos if f not in FORMATOS]
+    if invalidos or not formatos:
+        raise argparse.ArgumentTypeError(f"formatos válidos: {', '.join(FORMATOS)}")
+    return formatos
+
+
+def comando_xte2tab(args):
+    from amconsultoria.cache_parquet import CacheParquet
+    from amconsultoria.esquema import COLUNAS_FINAIS, concatenar
+    from amconsultoria.exportacao import exportar_consolidado
+    from amconsultoria.ingestao import ler_xtes_em_paralelo
+
+    arquivos = expandir_entradas(args.entradas, EXTENSOES_LOTE)
+    if not arquivos:
+        _log("Nenhum arquivo .xte/.xml/.zip encontrado.")
+        return 1
+
+    inicio = time.time()
+
+    def progresso(concluidos, total, nome):
+        _log(f"[{concluidos}/{total}] {nome}")
+
+    falhas = []
+
+    def falha(nome, erro):
+        falhas.append(nome)
+        _log(f"ERRO {nome}: {type(erro).__name__}: {erro}")
+
+    cache = None if args.sem_cache else CacheParquet()
+    dfs = ler_xtes_em_paralelo(arquivos, max_workers=args.processos, ao_concluir=progresso, cache=cache,
+                               ao_falhar=falha)
+    final_df = concatenar(dfs)
+    caminhos = exportar_consolidado(final_df, args.saida, formatos=args.formatos, colunas=COLUNAS_FINAIS)
+    for caminho in caminhos.values():
+        print(caminho)
+    _log(f"{sum(df is not None for df in dfs)} XTE(s), {len(final_df)} linha(s) em {time.time() - inicio:.1f}s")
+    return 1 if falhas else 0
+
+
+def comando_tab2xte(args):
+    from amconsultoria.gerador_xte import gerar_xte_em_diretorio
+
+    planilhas = expandir_entradas(args.entradas, EXTENSOES_PLANILHA)
+    if not planilhas:
+        _log("Nenhuma planilha .xlsx/.csv encontrada.")
+        return 1
+    # Entradas passadas por nome não são filtradas por extensão; o leitor (openpyxl) não abre o .xls antigo
+    antigas = [p for p in planilhas if p.lower().endswith(".xls")]
+    if antigas:
+        _log(f"Formato .xls não suportado; salve como .xlsx ou .csv: {', '.join(antigas)}")
+        return 1
+
+    extensoes = {"xte": (".xte",), "xml": (".xml",), "ambas": (".xte", ".xml")}[args.extensao]
+    for n, planilha in enumerate(planilhas, start=1):
+        # Com várias planilhas, cada uma ganha a sua pasta para não misturar origens homônimas
+        diretorio = args.saida
+        if len(planilhas) > 1:
+            diretorio = os.path.join(args.saida, os.path.splitext(os.path.basename(planilha))[0])
+        _log(f"[{n}/{len(planilhas)}] {planilha}")
+
+        def avisar(problemas, total):
+            for problema in problemas[:LIMITE_AVISOS]:
+                _log(f"AVISO linha {problema.linha}, {problema.coluna}: {problema.mensagem} ({problema.valor!r})")
+            if total > LIMITE_AVISOS:
+                _log(f"AVISO ... e mais {total - LIMITE_AVISOS} problema(s) na planilha")
+
+        for caminho in gerar_xte_em_diretorio(planilha, diretorio, extensoes=extensoes, incremental=args.incremental,
+                                              ao_problemas=avisar):
+            print(caminho)
+    return 0
+
+
+def comando_verificar(args):
+    from amconsultoria.hash_xte import verificar_hash_xte
+
+    arquivos = expandir_entradas(args.entradas, EXTENSOES_XTE)
+    falhas = 0
+    for caminho in arquivos:
+        with open(caminho, "rb") as f:
+            valido, informado, calculado = verificar_hash_xte(f)
+        if not valido:
+            falhas += 1
+        print(f"{'OK' if valido else 'ERRO'}\t{caminho}\tinformado={informado}\tcalculado={calculado}")
+    return 1 if falhas else 0
+
+
+def comando_validar(args):
+    from amconsultoria.validacao_xsd import resumo_erro, validar_lote
+
+    arquivos = expandir_entradas(args.entradas, EXTENSOES_XTE)
+    por_guia = True if args.por_guia else None
+    resultado = validar_lote({caminho: caminho for caminho in arquivos}, max_workers=args.threads,
+                             caminho_xsd=args.xsd, por_guia=por_guia)
+    invalidos = 0
+    for caminho, erros in resultado.items():
+        if erros:
+            invalidos += 1
+        print(f"{'OK' if not erros else 'ERRO'}\t{caminho}\t{len(erros)} erro(s)")
+        for erro in erros:
+            print(f"  {resumo_erro(erro)}")
+    return 1 if invalidos else 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog="python -m amconsultoria", description="Conversões XTE ⇄ Excel da AM Consultoria.")
+    parser.add_argument("--diagnostico", action="store_true", help="emite no stderr uma linha JSON por etapa medida")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    xte2tab = comandos.add_parser("xte2tab", help="consolida arquivos XTE em Excel/CSV/Parquet/Arrow")
+    xte2tab.add_argument("entradas", nargs="+", help="arquivos, diretórios ou globs de .xte/.xml/.zip")
+    xte2tab.add_argument("-o", "--saida", required=True, help="diretório de saída")
+    xte2tab.add_argument("--formatos", type=_formatos, default=FORMATOS, help="lista separada por vírgula (padrão: todos)")
+    xte2tab.add_argument("--processos", type=int, default=None, help="processos de leitura (padrão: XTE_PROCESSOS ou nº de CPUs)")
+    xte2tab.add_argument("--sem-cache", action="store_true", help="não usa o cache Parquet em disco")
+    xte2tab.set_defaults(funcao=comando_xte2tab)
+
+    tab2xte = comandos.add_parser("tab2xte", help="gera XTE a partir de planilhas Excel/CSV")
+    tab2xte.add_argument("entradas", nargs="+", help="arquivos, diretórios ou globs de .xlsx/.csv")
+    tab2xte.add_argument("-o", "--saida", required=True, help="diretório de saída")
+    tab2xte.add_argument("--extensao", choices=("xte", "xml", "ambas"), default="xte")
+    tab2xte.add_argument("--incremental", action="store_true",
+                         help="mantém os arquivos das origens que não mudaram desde a última geração no diretório")
+    tab2xte.set_defaults(funcao=comando_tab2xte)
+
+    verificar = comandos.add_parser("verificar", help="confere o hash do epílogo de arquivos XTE")
+    verificar.add_argument("entradas", nargs="+", help="arquivos, diretórios ou globs de .xte/.xml")
+    verificar.set_defaults(funcao=comando_verificar)
+
+    validar = comandos.add_parser("validar", help="valida arquivos XTE contra o XSD do TISS")
+    validar.add_argument("entradas", nargs="+", help="arquivos, diretórios ou globs de .xte/.xml")
+    validar.add_argument("--xsd", default=None, help="XSD principal (padrão: XTE_XSD ou amconsultoria/xsd/)")
+    validar.add_argument("--por-guia", action="store_true", help="valida guia por guia, em streaming")
+    validar.add_argument("--threads", type=int, default=None)
+    validar.set_defaults(funcao=comando_validar)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.diagnostico:
+        from amconsultoria.diagnostico import configurar_log
+
+        configurar_log()
+    try:
+        return args.funcao(args)
+    except FileNotFoundError as erro:
+        _log(str(erro))
+        return 2
@@ -0,0 +1,169 @@
+"""Consultas sobre o consolidado exportado em Arrow (IPC), sem carregar tudo no pandas.
+
+A tabela é aberta com memory map: só as páginas e colunas consultadas são lidas do
+disco. As colunas de busca ganham um índice hash (valor → linhas) e os resumos por
+competência, operadora e arquivo de origem ficam calculados de antemão:
+
+    consulta = ConsultaConsolidada.abrir("dados_consolidados.arrow")
+    linhas = consulta.buscar({"cpfBeneficiario": "12345678901"})
+    consulta.pagina(0, linhas=linhas)
+"""
+
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_INDEXADAS = ("numeroGuia_prestador", "numeroGuia_operadora", "cpfBeneficiario", "codigoProcedimento")
+COLUNAS_RESUMO = ("competenciaLote", "registroANS_cabecalho", "Nome da Origem")
+VALORES_RESUMO = ("valorInformado_proc", "valorPagoProc")
+TAMANHO_PAGINA = 50
+
+
+def _texto(valor):
+    return str(valor).strip()
+
+
+class IndiceHash:
+    """Índice de uma coluna: valor (texto, sem espaços nas pontas) → posições das linhas.
+
+    As posições ficam em um único array ordenado por valor, com o início de cada
+    valor ao lado (formato CSR), em vez de um array por valor: a memória é a de
+    dois inteiros por linha mais o dicionário dos valores distintos.
+    """
+
+    def __init__(self, serie):
+        codigos, valores = pd.factorize(serie, sort=False)
+        # Valores que só diferem por espaços nas pontas caem no mesmo código
+        normalizados, distintos = pd.factorize(pd.Index(valores).map(_texto))
+        codigos = np.where(codigos >= 0, normalizados[np.maximum(codigos, 0)], -1)
+        self._ordem = np.argsort(codigos, kind="stable")
+        contagens = np.bincount(codigos[codigos >= 0], minlength=len(distintos))
+        nulos = len(codigos) - int(contagens.sum())
+        self._inicios = np.concatenate([[0], np.cumsum(contagens)]) + nulos
+        self._posicao = {valor: i for i, valor in enumerate(distintos)}
+
+    def __len__(self):
+        return len(self._posicao)
+
+    def linhas(self, valor):
+        """Posições (crescentes) das linhas com `valor`; array vazio quando não existe."""
+        codigo = self._posicao.get(_texto(valor))
+        if codigo is None:
+            return np.empty(0, dtype=np.intp)
+        return self._ordem[self._inicios[codigo]:self._inicios[codigo + 1]]
+
+
+class ConsultaConsolidada:
+    """Buscas indexadas, páginas e resumos sobre uma tabela Arrow do consolidado.
+
+    Índices e resumos são montados na primeira vez que são pedidos (ou todos de uma
+    vez em `preparar`) e depois só lidos, então a mesma consulta pode ser usada por
+    várias sessões ao mesmo tempo.
+    """
+
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.linhas = tabela.num_rows
+        # Table.take junta os blocos de cada coluna antes de selecionar; por lote só
+        # os lotes que têm linhas da página são tocados
+        self._lotes = tabela.to_batches()
+        self._inicios_lotes = np.cumsum([0] + [lote.num_rows for lote in self._lotes])
+        self._indices = {}
+        self._resumos = {}
+        self._trava = threading.Lock()
+
+    @classmethod
+    def abrir(cls, caminho):
+        import pyarrow as pa
+
+        with pa.memory_map(caminho, "r") as origem:
+            return cls(pa.ipc.open_file(origem).read_all())
+
+    @property
+    def colunas_indexadas(self):
+        return [col for col in COLUNAS_INDEXADAS if col in self.tabela.column_names]
+
+    @property
+    def colunas_resumo(self):
+        return [col for col in COLUNAS_RESUMO if col in self.tabela.column_names]
+
+    def preparar(self):
+        """Monta todos os índices e resumos de uma vez (ex.: ainda na tarefa de consolidação)."""
+        for coluna in self.colunas_indexadas:
+            self.indice(coluna)
+        for coluna in self.colunas_resumo:
+            self.resumo(coluna)
+        return self
+
+    def indice(self, coluna):
+        with self._trava:
+            if coluna not in self._indices:
+                self._indices[coluna] = IndiceHash(self.tabela.column(coluna).to_pandas())
+            return self._indices[coluna]
+
+    def buscar(self, filtros):
+        """Linhas que atendem a todos os `filtros` {coluna indexada: valor ou lista de valores}."""
+        resultado = None
+        for coluna, valores in filtros.items():
+            if isinstance(valores, (str, bytes)) or not hasattr(valores, "__iter__"):
+                valores = [valores]
+            indice = self.indice(coluna)
+            linhas = np.unique(np.concatenate([indice.linhas(valor) for valor in valores] or [np.empty(0, dtype=np.intp)]))
+            resultado = linhas if resultado is None else np.intersect1d(resultado, linhas, assume_unique=True)
+        return np.arange(self.linhas) if resultado is None else resultado
+
+    def paginas(self, total=None, tamanho=TAMANHO_PAGINA):
+        total = self.linhas if total is None else total
+        return max(1, math.ceil(total / tamanho))
+
+    def pagina(self, numero, tamanho=TAMANHO_PAGINA, linhas=None):
+        """DataFrame com a página `numero` (a partir de 0) da tabela inteira ou das `linhas` buscadas.
+
+        O índice do DataFrame é a posição da linha no consolidado.
+        """
+        inicio = numero * tamanho
+        if linhas is None:
+            fim = min(inicio + tamanho, self.linhas)
+            df = self.tabela.slice(inicio, max(fim - inicio, 0)).to_pandas()
+            df.index = pd.RangeIndex(inicio, inicio + len(df))
+        else:
+            selecionadas = np.asarray(linhas)[inicio:inicio + tamanho]
+            df = self._selecionar(selecionadas).to_pandas()
+            df.index = selecionadas
+        return df
+
+    def _selecionar(self, posicoes):
+        import pyarrow as pa
+
+        lotes = np.searchsorted(self._inicios_lotes, posicoes, side="right") - 1
+        partes = []
+        for lote in np.unique(lotes):
+            locais = posicoes[lotes == lote] - self._inicios_lotes[lote]
+            partes.append(self._lotes[lote].take(pa.array(locais)))
+        return pa.Table.from_batches(partes, schema=self.tabela.schema)
+
+    def resumo(self, coluna):
+        """Linhas, guias distintas e totais de valores por `coluna` (uma de COLUNAS_RESUMO)."""
+        with self._trava:
+            if coluna not in self._resumos:
+                self._resumos[coluna] = self._resumir(coluna)
+            return self._resumos[coluna]
+
+    def _resumir(self, coluna):
+        existentes = self.tabela.column_names
+        valores = [col for col in VALORES_RESUMO if col in existentes]
+        extras = ["numeroGuia_prestador"] if "numeroGuia_prestador" in existentes and coluna != "numeroGuia_prestador" else []
+        df = self.tabela.select([coluna] + extras + valores).to_pandas()
+        for col in valores:
+            # Colunas que ficaram como texto (algum valor não numérico) somam só os números
+            if df[col].dtype == object:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        agregacoes = {"linhas": (coluna, "size")}
+        if extras:
+            agregacoes["guias"] = ("numeroGuia_prestador", "nunique")
+        for col in valores:
+            agregacoes[col] = (col, "sum")
+        resumo = df.groupby(coluna, observed=True, dropna=False, sort=True).agg(**agregacoes)
+        return resumo.reset_index()
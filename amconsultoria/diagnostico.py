@@ -0,0 +1,186 @@
+"""Medição por etapa (tempo, linhas, bytes, RSS) das conversões.
+
+Cada etapa vira um registro (dict) que é emitido como uma linha JSON no logger
+`amconsultoria.diagnostico` e guardado no coletor ativo, quando houver um:
+
+    with coletar() as registros:
+        with etapa("exportacao.csv") as medicao:
+            ...
+            medicao.linhas = len(df)
+
+Os coletores são por thread (cada sessão do Streamlit roda na sua). Registros feitos
+em processos filhos voltam ao processo principal e entram no coletor com `repassar`.
+
+O `pico_rss_mb` de uma etapa é o maior RSS do processo durante ela: o pico do kernel
+(VmHWM) é zerado na abertura, via /proc/self/clear_refs, e lido no fechamento. Fora
+do Linux (ou sem permissão para zerar) o campo vai como None.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("amconsultoria.diagnostico")
+
+_local = threading.local()
+
+
+def _pilha():
+    if not hasattr(_local, "coletores"):
+        _local.coletores = []
+    return _local.coletores
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def _vmhwm_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _zerar_vmhwm():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Medições de pico abertas no processo (de todas as threads): o VmHWM é do processo
+# inteiro, então antes de zerá-lo o pico até ali é repassado a cada uma delas
+_trava_pico = threading.Lock()
+_picos_abertos = []
+_pico_disponivel = None
+
+
+def _reiniciar_apos_fork():
+    global _trava_pico, _picos_abertos
+    _trava_pico = threading.Lock()
+    _picos_abertos = []
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+
+class Pico:
+    """Maior RSS (MiB) do processo dentro de `medir_pico`; `mb` fica None onde não dá para medir."""
+
+    def __init__(self):
+        self.mb = None
+        self._visto = 0.0
+
+
+@contextmanager
+def medir_pico():
+    global _pico_disponivel
+    pico = Pico()
+    medindo = False
+    if _pico_disponivel is not False:
+        with _trava_pico:
+            atual = _vmhwm_mb()
+            if atual is not None:
+                for aberto in _picos_abertos:
+                    aberto._visto = max(aberto._visto, atual)
+                medindo = _pico_disponivel = _zerar_vmhwm()
+            else:
+                _pico_disponivel = False
+            if medindo:
+                _picos_abertos.append(pico)
+    try:
+        yield pico
+    finally:
+        if medindo:
+            with _trava_pico:
+                _picos_abertos.remove(pico)
+                pico.mb = max(pico._visto, _vmhwm_mb() or 0.0)
+
+
+@contextmanager
+def coletar():
+    """Guarda os registros feitos dentro do bloco (na thread atual) na lista devolvida."""
+    registros = []
+    pilha = _pilha()
+    pilha.append(registros)
+    try:
+        yield registros
+    finally:
+        pilha.remove(registros)
+
+
+def repassar(registros):
+    """Entrega ao coletor ativo registros já emitidos em outro processo (sem logar de novo)."""
+    pilha = _pilha()
+    if pilha:
+        pilha[-1].extend(registros)
+
+
+def registrar(nome, segundos, linhas=None, bytes=None, pico=None, **contexto):
+    """Emite o registro de uma etapa; `pico` é o Pico medido nela (sem ele, pico_rss_mb vai None)."""
+    rss = _rss_mb()
+    pico_mb = pico.mb if pico is not None else None
+    registro = {
+        "etapa": nome,
+        "segundos": round(segundos, 6),
+        "linhas": linhas,
+        "bytes": bytes,
+        "rss_mb": rss,
+        # O kernel atualiza o pico com atraso; ele nunca é menor que o RSS atual
+        "pico_rss_mb": None if pico_mb is None else max(pico_mb, rss or 0),
+        "pid": os.getpid(),
+    }
+    registro.update(contexto)
+    pilha = _pilha()
+    if pilha:
+        pilha[-1].append(registro)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+    return registro
+
+
+class Medicao:
+    """Volume processado em uma etapa; preenchido pelo código medido."""
+
+    def __init__(self, contexto):
+        self.linhas = None
+        self.bytes = None
+        self.contexto = contexto
+
+
+@contextmanager
+def etapa(nome, **contexto):
+    medicao = Medicao(contexto)
+    inicio = time.perf_counter()
+    try:
+        with medir_pico() as pico:
+            yield medicao
+    finally:
+        registrar(nome, time.perf_counter() - inicio, medicao.linhas, medicao.bytes, pico, **medicao.contexto)
+
+
+def configurar_log(stream=None, nivel=logging.INFO):
+    """Manda as linhas JSON para `stream` (padrão: stderr). Chamadas repetidas não duplicam o handler."""
+    if not any(getattr(h, "_amconsultoria", False) for h in logger.handlers):
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._amconsultoria = True
+        logger.addHandler(handler)
+    logger.setLevel(nivel)
+    logger.propagate = False
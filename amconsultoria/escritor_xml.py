@@ -0,0 +1,83 @@
+ENCODING_XTE = "iso-8859-1"
+LIMITE_PARTES = 4096  # pedaços acumulados antes de gravar no stream
+
+
+def escapar_texto(texto):
+    # Mesmo escape do minidom; \r vira \n como o expat faria ao reler o documento
+    if "&" in texto:
+        texto = texto.replace("&", "&amp;")
+    if "<" in texto:
+        texto = texto.replace("<", "&lt;")
+    if '"' in texto:
+        texto = texto.replace('"', "&quot;")
+    if ">" in texto:
+        texto = texto.replace(">", "&gt;")
+    if "\r" in texto:
+        texto = texto.replace("\r\n", "\n").replace("\r", "\n")
+    return texto
+
+
+class EscritorXMLIndentado:
+    """Escreve XML já indentado direto em um stream binário, elemento por elemento.
+
+    O resultado é o mesmo de `minidom.toprettyxml(indent="  ", encoding=...)` sobre a
+    árvore equivalente: elementos só com texto ficam em uma linha e elementos sem
+    filhos viram `<tag/>`. Nenhuma árvore é montada; a memória usada é a do buffer
+    de saída, descarregado a cada LIMITE_PARTES pedaços.
+
+    `ao_escrever_texto`, se informado, recebe o texto (sem escape) de cada campo
+    na ordem do documento.
+    """
+
+    def __init__(self, stream, encoding=ENCODING_XTE, indentacao="  ", ao_escrever_texto=None):
+        self.stream = stream
+        self.encoding = encoding
+        self.ao_escrever_texto = ao_escrever_texto
+        self._indentacao = indentacao
+        self._recuos = [""]
+        self._abertos = []
+        self._pendente = False
+        self._partes = [f'<?xml version="1.0" encoding="{encoding}"?>\n']
+
+    def _recuo(self, nivel):
+        while len(self._recuos) <= nivel:
+            self._recuos.append(self._recuos[-1] + self._indentacao)
+        return self._recuos[nivel]
+
+    def _confirmar_pai(self):
+        if self._pendente:
+            self._partes.append(">\n")
+            self._pendente = False
+
+    def abrir(self, tag, atributos=None):
+        self._confirmar_pai()
+        texto_atributos = "".join(f' {nome}="{escapar_texto(valor)}"' for nome, valor in (atributos or {}).items())
+        self._partes.append(f"{self._recuo(len(self._abertos))}<{tag}{texto_atributos}")
+        self._abertos.append(tag)
+        self._pendente = True
+
+    def campo(self, tag, texto):
+        self._confirmar_pai()
+        if self.ao_escrever_texto is not None:
+            self.ao_escrever_texto(texto)
+        self._partes.append(f"{self._recuo(len(self._abertos))}<{tag}>{escapar_texto(texto)}</{tag}>\n")
+        if len(self._partes) >= LIMITE_PARTES:
+            self.descarregar()
+
+    def fechar(self):
+        tag = self._abertos.pop()
+        if self._pendente:
+            self._partes.append("/>\n")
+            self._pendente = False
+        else:
+            self._partes.append(f"{self._recuo(len(self._abertos))}</{tag}>\n")
+
+    def descarregar(self):
+        if self._partes:
+            self.stream.write("".join(self._partes).encode(self.encoding, "xmlcharrefreplace"))
+            self._partes.clear()
+
+    def finalizar(self):
+        while self._abertos:
+            self.fechar()
+        self.descarregar()
@@ -0,0 +1,158 @@
+import logging
+
+import pandas as pd
+
+from amconsultoria.diagnostico import etapa
+from amconsultoria.layout_tiss import CATEGORIA, NUMERO, PLANO_CABECALHO, PLANO_GUIA, TEXTO, tipos_do_plano
+
+logger = logging.getLogger(__name__)
+
+# Tipos de coluna (TEXTO, CATEGORIA, NUMERO, DATA) vêm do layout TISS; aqui só as colunas fora dele
+COLUNAS_FORA_DO_LAYOUT = {
+    'Nome da Origem': CATEGORIA,
+    # Nomes antigos dos valores do procedimento, mantidos (vazios) no layout da planilha
+    'valorInformado': NUMERO,
+    'valorPagoFornecedor': NUMERO,
+    'Idade_na_Realização': NUMERO,
+}
+
+# Ordem das colunas do Excel/CSV consolidado; campos do layout TISS fora desta lista vão para o final
+ORDEM_EXPORTACAO = [
+    'Nome da Origem', 'tipoRegistro', 'versaoTISSPrestador', 'formaEnvio', 'tipoTransacao', 'numeroLote',
+    'competenciaLote', 'dataRegistroTransacao_cabecalho', 'horaRegistroTransacao_cabecalho', 'registroANS_cabecalho',
+    'versaoPadrao_cabecalho', 'CNES', 'identificadorExecutante', 'codigoCNPJ_CPF', 'municipioExecutante',
+    'registroANSOperadoraIntermediaria', 'tipoAtendimentoOperadoraIntermediaria', 'numeroCartaoNacionalSaude',
+    'cpfBeneficiario', 'sexo', 'dataNascimento', 'municipioResidencia', 'numeroRegistroPlano', 'tipoEventoAtencao',
+    'origemEventoAtencao', 'numeroGuia_prestador', 'numeroGuia_operadora', 'identificacaoReembolso',
+    'formaRemuneracao', 'valorRemuneracao', 'guiaSolicitacaoInternacao', 'dataSolicitacao',
+    'numeroGuiaSPSADTPrincipal', 'dataAutorizacao', 'dataRealizacao', 'dataFimPeriodo', 'dataInicialFaturamento',
+    'dataProtocoloCobranca', 'dataPagamento', 'dataProcessamentoGuia', 'tipoConsulta', 'cboExecutante',
+    'indicacaoRecemNato', 'indicacaoAcidente', 'caraterAtendimento', 'tipoInternacao', 'regimeInternacao',
+    'tipoAtendimento', 'regimeAtendimento', 'tipoFaturamento', 'diariasAcompanhante', 'diariasUTI', 'motivoSaida',
+    'valorTotalInformado', 'valorProcessado', 'valorTotalPagoProcedimentos', 'valorTotalDiarias', 'valorTotalTaxas',
+    'valorTotalMateriais', 'valorTotalOPME', 'valorTotalMedicamentos', 'valorGlosaGuia', 'valorPagoGuia',
+    'valorPagoFornecedores', 'valorTotalTabelaPropria', 'valorTotalCoParticipacao', 'declaracaoNascido',
+    'declaracaoObito', 'codigoTabela', 'grupoProcedimento', 'codigoProcedimento', 'quantidadeInformada',
+    'valorInformado', 'valorInformado_proc', 'valorPagoFornecedor', 'quantidadePaga', 'unidadeMedida',
+    'valorCoParticipacao', 'valorPagoProc', 'valorPagoFornecedor_proc', 'Idade_na_Realização', 'diagnosticoCID',
+]
+
+_TIPOS = {**tipos_do_plano(PLANO_CABECALHO), **tipos_do_plano(PLANO_GUIA), **COLUNAS_FORA_DO_LAYOUT}
+# Layout das colunas do Excel/CSV consolidado, na ordem de exportação
+ESQUEMA = {col: _TIPOS[col] for col in ORDEM_EXPORTACAO}
+ESQUEMA.update((col, tipo) for col, tipo in _TIPOS.items() if col not in ESQUEMA)
+
+COLUNAS_FINAIS = list(ESQUEMA)
+COLUNAS_NUMERICAS = [col for col, tipo in ESQUEMA.items() if tipo == NUMERO]
+# Valores do TISS, escritos como texto nas planilhas (as quantidades já são o texto do XTE)
+COLUNAS_DECIMAIS = [col for col in COLUNAS_NUMERICAS if col != 'Idade_na_Realização']
+# Valores monetários têm duas casas no TISS; os demais números saem sem casas fixas
+FORMATO_VALOR = '%.2f'
+FORMATO_NUMERO = '%.15g'
+EXEMPLOS_INVALIDOS = 5
+
+
+def formato_numero(coluna):
+    return FORMATO_VALOR if coluna.startswith('valor') else FORMATO_NUMERO
+
+
+def _vazia(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.categories.empty
+    return not serie.notna().any()
+
+
+def _numerica(serie, coluna):
+    numeros = pd.to_numeric(serie, errors="coerce")
+    candidatos = numeros.isna() & serie.notna()
+    if not candidatos.any():
+        return numeros
+    textos = serie[candidatos].astype(str)
+    invalidos = textos[textos.str.strip() != ""]
+    if invalidos.empty:
+        return numeros
+    # Um texto que não é número não é descartado: a coluna fica com o texto original
+    exemplos = ", ".join(repr(valor) for valor in invalidos.unique()[:EXEMPLOS_INVALIDOS])
+    logger.warning("Coluna %s: %d valor(es) não numérico(s) (ex.: %s); a coluna foi mantida como texto.",
+                   coluna, len(invalidos), exemplos)
+    return serie.mask(serie == "")
+
+
+def aplicar_esquema(df):
+    """Converte as colunas do layout para os tipos compactos e ordena pelo layout.
+
+    Textos vazios contam como ausentes e colunas sem nenhum valor não são guardadas:
+    a exportação recria as colunas do layout na hora de escrever. Uma coluna
+    numérica com algum texto que não é número fica como texto (e é avisada no log).
+    """
+    colunas = {}
+    for col in COLUNAS_FINAIS:
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        tipo = ESQUEMA[col]
+        if tipo == CATEGORIA:
+            serie = serie.astype("category")
+            if "" in serie.cat.categories:
+                serie = serie.cat.remove_categories([""])
+        elif tipo == NUMERO:
+            serie = _numerica(serie, col)
+        elif tipo == TEXTO and serie.dtype == object:
+            serie = serie.mask(serie == "")
+        if not _vazia(serie):
+            colunas[col] = serie
+    return pd.DataFrame(colunas, index=df.index)
+
+
+def definir_origem(df, nome):
+    df['Nome da Origem'] = pd.Categorical([nome] * len(df))
+    return df
+
+
+def concatenar(dfs):
+    """pd.concat que mantém as colunas categóricas (unindo as categorias de cada arquivo).
+
+    Colunas que faltam em algum arquivo entram vazias com o mesmo tipo das demais,
+    para o concat não cair para object. O resultado segue a ordem do layout.
+    """
+    dfs = [df for df in dfs if df is not None]
+    if not dfs:
+        return pd.DataFrame(columns=COLUNAS_FINAIS)
+    with etapa("consolidacao", arquivos=len(dfs)) as medicao:
+        df = _concatenar(dfs)
+        medicao.linhas = len(df)
+    return df
+
+
+def _concatenar(dfs):
+    presentes = set().union(*(df.columns for df in dfs))
+    colunas = [col for col in COLUNAS_FINAIS if col in presentes]
+    colunas += [col for df in dfs for col in df.columns if col not in ESQUEMA and col not in colunas]
+
+    tipos = {}
+    for col in colunas:
+        series = [df[col] for df in dfs if col in df.columns]
+        if all(isinstance(s.dtype, pd.CategoricalDtype) for s in series):
+            categorias = pd.Index([]).append([s.cat.categories for s in series]).unique()
+            tipos[col] = pd.CategoricalDtype(categorias)
+        elif ESQUEMA.get(col) == NUMERO and any(s.dtype == object for s in series):
+            # Algum arquivo trouxe texto na coluna numérica: a coluna inteira vira texto
+            tipos[col] = object
+        else:
+            tipos[col] = series[0].dtype
+
+    alinhados = []
+    for df in dfs:
+        partes = {}
+        for col in colunas:
+            if col in df.columns:
+                serie = df[col]
+                if isinstance(tipos[col], pd.CategoricalDtype):
+                    serie = serie.cat.set_categories(tipos[col].categories)
+                elif tipos[col] == object and serie.dtype.kind in "iuf":
+                    serie = serie.map(formato_numero(col).__mod__, na_action="ignore").astype(object)
+            else:
+                serie = pd.Series(index=df.index, dtype=tipos[col])
+            partes[col] = serie
+        alinhados.append(pd.DataFrame(partes, index=df.index))
+    return pd.concat(alinhados, ignore_index=True)
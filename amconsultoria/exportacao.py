@@ -0,0 +1,156 @@
+import os
+
+from amconsultoria.diagnostico import etapa
+from amconsultoria.esquema import COLUNAS_DECIMAIS, FORMATO_NUMERO, formato_numero
+
+FORMATO_DATA_EXPORTACAO = '%d/%m/%Y'
+LIMITE_LINHAS_EXCEL = 1_048_576  # inclui a linha de cabeçalho
+TAMANHO_BLOCO_EXPORTACAO = 100_000
+
+NOMES_ARQUIVOS = {
+    "xlsx": "dados_consolidados.xlsx",
+    "csv": "dados_consolidados.csv",
+    "parquet": "dados_consolidados.parquet",
+    "arrow": "dados_consolidados.arrow",
+}
+
+MIMES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def _blocos(df, tamanho):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+
+def formatar_datas(bloco):
+    """Troca as colunas datetime64 pelo texto dd/mm/AAAA usado no Excel/CSV."""
+    colunas_data = bloco.select_dtypes(include="datetime").columns
+    if len(colunas_data) == 0:
+        return bloco
+    bloco = bloco.copy()
+    for col in colunas_data:
+        bloco[col] = bloco[col].dt.strftime(FORMATO_DATA_EXPORTACAO)
+    return bloco
+
+
+def formatar_numeros(bloco):
+    """Troca os valores monetários pelo texto com duas casas usado no Excel/CSV."""
+    colunas = [col for col in COLUNAS_DECIMAIS if col in bloco.columns and bloco[col].dtype.kind in "iuf"]
+    if not colunas:
+        return bloco
+    bloco = bloco.copy()
+    for col in colunas:
+        bloco[col] = bloco[col].map(formato_numero(col).__mod__, na_action="ignore")
+    return bloco
+
+
+def _preparar_bloco(bloco, colunas):
+    # Colunas do layout que não foram guardadas (vazias) voltam só na hora de escrever
+    if colunas is not None:
+        bloco = bloco.reindex(columns=colunas)
+    return bloco
+
+
+def _linhas_para_excel(bloco):
+    # Valores e quantidades seguem como texto, igual ao CSV e ao XTE
+    bloco = formatar_numeros(formatar_datas(bloco))
+    # Células nulas viram None para o XlsxWriter deixá-las em branco
+    valores = bloco.astype(object).where(bloco.notna(), None)
+    return valores.itertuples(index=False, name=None)
+
+
+def exportar_excel(df, destino, linhas_por_planilha=LIMITE_LINHAS_EXCEL - 1, colunas=None):
+    """Grava o DataFrame em .xlsx com o XlsxWriter em modo constant_memory.
+
+    Quando há mais linhas do que cabem em uma planilha do Excel, o restante segue
+    em novas planilhas (Sheet2, Sheet3, ...), cada uma com o seu cabeçalho.
+    `colunas` fixa o layout escrito (colunas ausentes saem em branco).
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(destino, {"constant_memory": True})
+    formato_cabecalho = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    cabecalho = [str(col) for col in (colunas if colunas is not None else df.columns)]
+    try:
+        planilhas = list(_blocos(df, linhas_por_planilha)) or [df]
+        for n, parte in enumerate(planilhas, start=1):
+            worksheet = workbook.add_worksheet(f"Sheet{n}")
+            worksheet.write_row(0, 0, cabecalho, formato_cabecalho)
+            linha = 1
+            for bloco in _blocos(parte, TAMANHO_BLOCO_EXPORTACAO):
+                for valores in _linhas_para_excel(_preparar_bloco(bloco, colunas)):
+                    worksheet.write_row(linha, 0, valores)
+                    linha += 1
+    finally:
+        workbook.close()
+    return destino
+
+
+def exportar_csv(df, destino, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO, colunas=None):
+    """Grava o CSV consolidado (separador ';') em blocos, sem montar o texto inteiro em memória."""
+    with open(destino, "w", encoding="utf-8", newline="") as f:
+        if df.empty:
+            _preparar_bloco(df, colunas).to_csv(f, index=False, sep=";", float_format=FORMATO_NUMERO, date_format=FORMATO_DATA_EXPORTACAO)
+            return destino
+        for n, bloco in enumerate(_blocos(df, tamanho_bloco)):
+            bloco = formatar_numeros(_preparar_bloco(bloco, colunas))
+            bloco.to_csv(f, index=False, header=(n == 0), sep=";", float_format=FORMATO_NUMERO, date_format=FORMATO_DATA_EXPORTACAO)
+    return destino
+
+
+def _tabela_arrow(df):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def exportar_parquet(df, destino):
+    import pyarrow.parquet as pq
+
+    pq.write_table(_tabela_arrow(df), destino)
+    return destino
+
+
+def exportar_arrow(df, destino, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """Grava no formato de arquivo Arrow IPC, um record batch por bloco de linhas."""
+    import pyarrow as pa
+
+    tabela = _tabela_arrow(df)
+    with pa.OSFile(destino, "wb") as sink:
+        with pa.ipc.new_file(sink, tabela.schema) as writer:
+            for batch in tabela.to_batches(max_chunksize=tamanho_bloco):
+                writer.write_batch(batch)
+    return destino
+
+
+EXPORTADORES = {
+    "xlsx": exportar_excel,
+    "csv": exportar_csv,
+    "parquet": exportar_parquet,
+    "arrow": exportar_arrow,
+}
+
+
+def exportar_consolidado(df, diretorio, formatos=("xlsx", "csv", "parquet", "arrow"), colunas=None):
+    """Exporta o DataFrame para os formatos pedidos em `diretorio`. Devolve {formato: caminho}.
+
+    `colunas` (layout completo) vale para as planilhas; Parquet e Arrow guardam só
+    as colunas existentes, com os tipos do DataFrame.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    caminhos = {}
+    for formato in formatos:
+        destino = os.path.join(diretorio, NOMES_ARQUIVOS[formato])
+        with etapa(f"exportacao.{formato}") as medicao:
+            medicao.linhas = len(df)
+            if formato in ("xlsx", "csv"):
+                caminhos[formato] = EXPORTADORES[formato](df, destino, colunas=colunas)
+            else:
+                caminhos[formato] = EXPORTADORES[formato](df, destino)
+            medicao.bytes = os.path.getsize(destino)
+    return caminhos
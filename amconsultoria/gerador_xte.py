@@ -0,0 +1,588 @@
+import io
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from amconsultoria.diagnostico import coletar, etapa, medir_pico, registrar, repassar
+from amconsultoria.escritor_xml import EscritorXMLIndentado
+from amconsultoria.hash_xte import atualizar_hash, novo_hash
+from amconsultoria.layout_tiss import NS, PLANO_CABECALHO, PLANO_GUIA, VERSAO_TISS, XSD_TISS, colunas_data, colunas_do_plano
+from amconsultoria.leitura_planilha import ler_por_origem
+from amconsultoria.manifesto_geracao import ManifestoGeracao, impressoes_por_origem
+from amconsultoria.pacote_zip import NIVEL_COMPRESSAO, PacoteZip, comprimir
+from amconsultoria.processos import contexto_multiprocessing, numero_de_processos
+from amconsultoria.validacao_xsd import carregar_esquema, validar_xte
+
+# Aumentar sempre que o XML gerado mudar (invalida os manifestos da geração incremental)
+VERSAO_GERADOR = 1
+CHAVES_GUIA = ["numeroGuia_prestador", "numeroGuia_operadora", "identificacaoReembolso"]
+REEMBOLSO_ZERADO = "00000000000000000000"
+
+
+def _converter_data(texto):
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(texto, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return texto
+
+
+class _Colunas:
+    """Colunas do Excel já preparadas uma única vez para a emissão.
+
+    `textos[coluna]` traz, por linha, o texto final do elemento (sem espaços, datas
+    convertidas) ou None quando o elemento não deve ser escrito. `presentes[coluna]`
+    indica as células não nulas, usado nos grupos opcionais.
+    """
+
+    def __init__(self, df, colunas_data):
+        self.df = df
+        self.total = len(df)
+        self.colunas_data = colunas_data
+        self._textos = {}
+        self._presentes = {}
+
+    def presentes(self, coluna):
+        if coluna not in self._presentes:
+            if coluna in self.df.columns:
+                self._presentes[coluna] = self.df[coluna].notna().tolist()
+            else:
+                self._presentes[coluna] = [False] * self.total
+        return self._presentes[coluna]
+
+    def textos(self, coluna):
+        if coluna not in self._textos:
+            self._textos[coluna] = self._preparar(coluna)
+        return self._textos[coluna]
+
+    def definir(self, coluna, textos):
+        self._textos[coluna] = textos
+
+    def _preparar(self, coluna):
+        if coluna not in self.df.columns:
+            return [None] * self.total
+        serie = self.df[coluna]
+        mascara = serie.notna().to_numpy()
+        limpos = serie[mascara].astype(str).str.strip()
+        if coluna in self.colunas_data:
+            # Cada data distinta é convertida uma vez só
+            convertidas = {texto: _converter_data(texto) for texto in limpos.unique() if texto}
+            limpos = limpos.map(lambda texto: convertidas.get(texto, texto))
+        valores = limpos.to_numpy(dtype=object)
+        valores[valores == ""] = None
+        textos = np.full(self.total, None, dtype=object)
+        textos[mascara] = valores
+        return textos.tolist()
+
+
+class _ValoresFixos:
+    """Mesma interface de _Colunas para um único registro, como o cabeçalho de um documento."""
+
+    def __init__(self, valores):
+        self.valores = valores
+
+    def textos(self, coluna):
+        return [self.valores.get(coluna)]
+
+    def presentes(self, coluna):
+        return [self.valores.get(coluna) is not None]
+
+
+def _compilar(plano, colunas):
+    """Troca os nomes de coluna do plano pelas listas de valores já preparadas."""
+    compilado = []
+    for tipo, tag, conteudo, se_presente in plano:
+        if tipo == "campo":
+            compilado.append((tipo, f"ans:{tag}", colunas.textos(conteudo), None))
+        elif tipo == "escolha":
+            alternativas = [(f"ans:{tag}", colunas.textos(coluna), colunas.presentes(coluna)) for _, tag, coluna, _ in conteudo]
+            compilado.append((tipo, None, alternativas, None))
+        else:
+            presentes = [colunas.presentes(c) for c in se_presente] if se_presente else None
+            compilado.append((tipo, f"ans:{tag}", _compilar(conteudo, colunas), presentes))
+    return compilado
+
+
+def _escrever(escritor, compilado, i, linhas=None):
+    """Escreve a linha `i`; os elementos repetidos são escritos uma vez para cada uma das `linhas`."""
+    for tipo, tag, valores, presentes in compilado:
+        if tipo == "campo":
+            texto = valores[i]
+            if texto is not None:
+                escritor.campo(tag, texto)
+        elif tipo == "escolha":
+            for tag_alternativa, textos, presentes_alternativa in valores:
+                if presentes_alternativa[i]:
+                    if textos[i] is not None:
+                        escritor.campo(tag_alternativa, textos[i])
+                    break
+        elif tipo == "repetido":
+            for j in linhas:
+                if presentes is None or any(p[j] for p in presentes):
+                    escritor.abrir(tag)
+                    _escrever(escritor, valores, j)
+                    escritor.fechar()
+        elif presentes is None or any(p[i] for p in presentes):
+            escritor.abrir(tag)
+            _escrever(escritor, valores, i, linhas)
+            escritor.fechar()
+
+
+def _blocos_de_guias(df):
+    """Devolve [(nome_origem, [posições de cada guia])] na mesma ordem dos groupby originais."""
+    if df.empty:
+        return []
+    codigos = df.groupby(["Nome da Origem"] + CHAVES_GUIA, dropna=False, sort=True).ngroup().to_numpy()
+    ordem = np.argsort(codigos, kind="stable")
+    inicios = np.flatnonzero(np.diff(codigos[ordem], prepend=-1))
+    guias = np.split(ordem, inicios[1:])
+
+    origens = df["Nome da Origem"].to_numpy(dtype=object)
+    presentes = df["Nome da Origem"].notna().to_numpy()
+    blocos = []
+    for posicoes in guias:
+        primeira = posicoes[0]
+        if not presentes[primeira]:
+            continue
+        nome = origens[primeira]
+        if blocos and blocos[-1][0] == nome:
+            blocos[-1][1].append(posicoes)
+        else:
+            blocos.append((nome, [posicoes]))
+    return blocos
+
+
+def nome_arquivo_saida(nome_origem):
+    nome_base, _ = os.path.splitext(nome_origem)
+    return re.sub(r'[^a-zA-Z0-9_\-]', '_', nome_base)
+
+
+def nome_unico(nome_limpo, usados):
+    """`nome_limpo` ou, se já estiver em `usados`, o primeiro `nome_limpo`_2, _3... livre (que entra em `usados`).
+
+    Origens diferentes podem ficar com o mesmo nome limpo ("a b.xlsx" e "a_b.xlsx").
+    """
+    nome, n = nome_limpo, 1
+    while nome in usados:
+        n += 1
+        nome = f"{nome_limpo}_{n}"
+    usados.add(nome)
+    return nome
+
+
+def agora_no_fuso():
+    fuso_horario_servidor = pytz.utc
+    fuso_horario_desejado = pytz.timezone("America/Sao_Paulo")
+    return datetime.now(fuso_horario_servidor).astimezone(fuso_horario_desejado)
+
+
+# Colunas da planilha lidas pela geração; as demais não precisam ir para os processos
+# (do cabeçalho, só as que vêm da planilha: tipo, lote, data e hora são calculados)
+COLUNAS_GERACAO = (
+    colunas_do_plano(PLANO_GUIA)
+    | {"Nome da Origem", "competenciaLote", "registroANS_cabecalho", "versaoPadrao_cabecalho"}
+    | set(CHAVES_GUIA)
+)
+# Conferidas na leitura: o texto vai para o XML como está, então precisa ser número
+COLUNAS_NUMERICAS = sorted(col for col in COLUNAS_GERACAO if col.startswith(("valor", "quantidade")))
+
+
+class GeracaoXTE:
+    """Prepara a planilha uma única vez e escreve cada arquivo de origem em um stream.
+
+    `blocos` lista (Nome da Origem, posições das linhas de cada guia) na ordem em
+    que os arquivos são gerados.
+    """
+
+    def __init__(self, df, agora=None):
+        # --- Setup de Data/Hora (fixado de fora quando várias gerações formam um mesmo lote) ---
+        agora_no_fuso_desejado = agora or agora_no_fuso()
+        self.data_atual = agora_no_fuso_desejado.strftime("%Y-%m-%d")
+        self.hora_atual = agora_no_fuso_desejado.strftime("%H:%M:%S")
+        # AJUSTE FINAL: Trocando Hora (%H) por Minuto (%M) na composição do lote.
+        self.minuto_e_segundos_atuais = agora_no_fuso_desejado.strftime("%M%S")
+        self.ano_e_mes_atuais = agora_no_fuso_desejado.strftime("%Y%m")
+
+        if "Nome da Origem" not in df.columns:
+            raise ValueError("A coluna 'Nome da Origem' é obrigatória no Excel.")
+
+        df = df.reset_index(drop=True)
+        with etapa("geracao.agrupamento") as medicao:
+            self.blocos = _blocos_de_guias(df)
+            medicao.linhas = len(df)
+            medicao.contexto["origens"] = len(self.blocos)
+
+        # --- Preparação das colunas (uma vez para o arquivo inteiro) ---
+        with etapa("geracao.preparacao") as medicao:
+            medicao.linhas = len(df)
+            self._preparar(df)
+
+    def _preparar(self, df):
+        colunas = _Colunas(df, colunas_data(PLANO_GUIA))
+        origem_evento = df["origemEventoAtencao"] if "origemEventoAtencao" in df.columns else pd.Series(None, index=df.index, dtype=object)
+        # Nas guias de origem 1, 2 e 3 o XML leva o reembolso zerado no lugar da coluna
+        colunas.definir("identificacaoReembolso", np.where(
+            origem_evento.isin(['1', '2', '3']).to_numpy(), REEMBOLSO_ZERADO,
+            np.array(colunas.textos("identificacaoReembolso"), dtype=object),
+        ).tolist())
+        self.plano_guia = _compilar(PLANO_GUIA, colunas)
+
+        self.competencias = df["competenciaLote"].to_numpy(dtype=object) if "competenciaLote" in df.columns else None
+        self.competencia_textos = colunas.textos("competenciaLote")
+        self.registro_ans = colunas.textos("registroANS_cabecalho")
+        if "versaoPadrao_cabecalho" in df.columns:
+            self.versao_padrao = colunas.textos("versaoPadrao_cabecalho")
+        else:
+            self.versao_padrao = [VERSAO_TISS] * len(df)
+
+    def numero_lote(self, linha_cabecalho):
+        # AJUSTE FINAL: Geração do numeroLote com Minuto e Segundo
+        competencia = self.competencias[linha_cabecalho] if self.competencias is not None else ""
+        if isinstance(competencia, str) and len(competencia) == 6 and competencia.isdigit():
+            return f"{competencia}{self.minuto_e_segundos_atuais}"
+        return f"{self.ano_e_mes_atuais}{self.minuto_e_segundos_atuais}"
+
+    def escrever(self, stream, guias, nome=None):
+        """Escreve em `stream` (binário) o documento de uma origem, guia por guia."""
+        inicio = time.perf_counter()
+        posicao_inicial = stream.tell()
+        with medir_pico() as pico:
+            # O hash do epílogo é alimentado à medida que cada texto é escrito; montagem,
+            # hash e serialização acontecem na mesma passada, então só o hash é medido à parte
+            md5 = novo_hash()
+            tempo_hash = 0.0
+
+            def alimentar_hash(texto):
+                nonlocal tempo_hash
+                antes = time.perf_counter()
+                atualizar_hash(md5, texto)
+                tempo_hash += time.perf_counter() - antes
+
+            escritor = EscritorXMLIndentado(stream, ao_escrever_texto=alimentar_hash)
+
+            escritor.abrir("ans:mensagemEnvioANS", {
+                "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance", "xmlns:xsd": "http://www.w3.org/2001/XMLSchema",
+                "xmlns:ans": NS, "xsi:schemaLocation": f"{NS} {NS}/{XSD_TISS}",
+            })
+
+            # O cabeçalho usa a primeira linha da origem na ordem da planilha
+            linha_cabecalho = min(int(posicoes[0]) for posicoes in guias)
+
+            # --- Bloco do Cabeçalho ---
+            cabecalho = _ValoresFixos({
+                "tipoTransacao": "MONITORAMENTO",
+                "numeroLote": self.numero_lote(linha_cabecalho),
+                "competenciaLote": self.competencia_textos[linha_cabecalho],
+                "dataRegistroTransacao_cabecalho": self.data_atual,
+                "horaRegistroTransacao_cabecalho": self.hora_atual,
+                "registroANS_cabecalho": self.registro_ans[linha_cabecalho],
+                "versaoPadrao_cabecalho": self.versao_padrao[linha_cabecalho],
+            })
+            escritor.abrir("ans:cabecalho")
+            _escrever(escritor, _compilar(PLANO_CABECALHO, cabecalho), 0)
+            escritor.fechar()
+
+            escritor.abrir("ans:Mensagem")
+            escritor.abrir("ans:operadoraParaANS")
+
+            # --- Loop Principal para cada Guia (os procedimentos vêm das linhas da guia) ---
+            for posicoes in guias:
+                escritor.abrir("ans:guiaMonitoramento")
+                _escrever(escritor, self.plano_guia, posicoes[0], posicoes.tolist())
+                escritor.fechar()
+
+            escritor.fechar()
+            escritor.fechar()
+
+            # --- Finalização com Hash ---
+            hash_value = md5.hexdigest()
+            escritor.ao_escrever_texto = None
+            escritor.abrir("ans:epilogo")
+            escritor.campo("ans:hash", hash_value)
+            escritor.finalizar()
+
+        linhas = sum(len(posicoes) for posicoes in guias)
+        registrar("geracao.hash", tempo_hash, linhas=linhas, pico=pico, origem=nome)
+        registrar("geracao.documento", time.perf_counter() - inicio, linhas=linhas,
+                  bytes=stream.tell() - posicao_inicial, pico=pico, origem=nome, guias=len(guias))
+
+
+def _escrever_em_diretorio(geracao, nome_arquivo, guias, diretorio, extensoes, nome_limpo):
+    principal = os.path.join(diretorio, f"{nome_limpo}{extensoes[0]}")
+    with open(principal, "wb") as saida:
+        geracao.escrever(saida, guias, nome=nome_arquivo)
+    caminhos = [principal]
+    for extensao in extensoes[1:]:
+        copia = os.path.join(diretorio, f"{nome_limpo}{extensao}")
+        if os.path.exists(copia):
+            os.remove(copia)
+        try:
+            os.link(principal, copia)
+        except OSError:
+            shutil.copyfile(principal, copia)
+        caminhos.append(copia)
+    return caminhos
+
+
+def ler_planilha_por_origem(excel_file, ao_problemas=None):
+    """Lê o Excel/CSV em blocos, só com as colunas usadas na geração, já separado por Nome da Origem.
+
+    Devolve uma PlanilhaPorOrigem. Datas e valores que a geração não vai conseguir
+    escrever direito são apontados na leitura: com `ao_problemas(problemas, total)`
+    a lista de ProblemaPlanilha (limitada) e a contagem são informadas no final.
+    """
+    nome = os.fspath(excel_file) if isinstance(excel_file, (str, os.PathLike)) else getattr(excel_file, 'name', '')
+    with etapa("geracao.leitura", arquivo=os.path.basename(nome)) as medicao:
+        planilha = ler_por_origem(excel_file, colunas=COLUNAS_GERACAO, colunas_data=colunas_data(PLANO_GUIA),
+                                  colunas_numericas=COLUNAS_NUMERICAS)
+        medicao.linhas = planilha.linhas
+        medicao.contexto["origens"] = len(planilha)
+        medicao.contexto["problemas"] = planilha.total_problemas
+    if ao_problemas is not None:
+        ao_problemas(planilha.problemas, planilha.total_problemas)
+    return planilha
+
+
+def gerar_xte_em_diretorio(excel_file, diretorio, extensoes=(".xte",), incremental=False, ao_problemas=None):
+    """Gera os arquivos de cada origem direto em `diretorio`, sem mantê-los em memória.
+
+    Com mais de uma extensão, as demais cópias são hard links do primeiro arquivo
+    (ou cópias, quando o sistema de arquivos não suporta links). Devolve os caminhos.
+    Nomes de arquivo repetidos ganham o sufixo _2, _3..., na ordem dos nomes de origem.
+
+    Com `incremental`, um manifesto no diretório guarda a impressão das linhas de
+    cada origem: numa nova execução, as origens cujas linhas não mudaram mantêm os
+    arquivos já gerados (com a data, hora e numeroLote da geração anterior) e só as
+    demais são montadas de novo. Arquivos de origens que saíram da planilha são apagados.
+
+    `ao_problemas` é repassado a `ler_planilha_por_origem`.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    df = ler_planilha_por_origem(excel_file, ao_problemas).dataframe()
+    if not incremental:
+        geracao = GeracaoXTE(df)
+        caminhos = []
+        usados = set()
+        for nome_arquivo, guias in geracao.blocos:
+            nome_limpo = nome_unico(nome_arquivo_saida(nome_arquivo), usados)
+            caminhos += _escrever_em_diretorio(geracao, nome_arquivo, guias, diretorio, extensoes, nome_limpo)
+        return caminhos
+
+    df = df.reset_index(drop=True)
+    anterior = ManifestoGeracao.carregar(diretorio, VERSAO_GERADOR, extensoes)
+    with etapa("geracao.impressao") as medicao:
+        medicao.linhas = len(df)
+        indices = df.groupby("Nome da Origem", sort=True).indices
+        impressoes = impressoes_por_origem(df, [col for col in df.columns if col in COLUNAS_GERACAO], indices)
+        # Os nomes são dados sobre todas as origens, na ordem da geração completa; uma origem
+        # só é reaproveitada se os arquivos dela continuam com o nome que ela recebe agora
+        usados = set()
+        nomes_limpos = {nome: nome_unico(nome_arquivo_saida(nome), usados) for nome in sorted(indices)}
+        alteradas = [nome for nome in sorted(indices)
+                     if not anterior.reaproveitavel(nome, impressoes[nome])
+                     or anterior.arquivos(nome) != [f"{nomes_limpos[nome]}{extensao}" for extensao in extensoes]]
+        medicao.contexto["origens"] = len(indices)
+        medicao.contexto["reaproveitadas"] = len(indices) - len(alteradas)
+
+    manifesto = ManifestoGeracao(diretorio, VERSAO_GERADOR, extensoes)
+    caminhos_por_origem = {}
+    if alteradas:
+        # Só as linhas das origens alteradas são preparadas, na ordem em que estão na planilha
+        posicoes = np.sort(np.concatenate([indices[nome] for nome in alteradas]))
+        geracao = GeracaoXTE(df.iloc[posicoes])
+        for nome_arquivo, guias in geracao.blocos:
+            caminhos_por_origem[nome_arquivo] = _escrever_em_diretorio(geracao, nome_arquivo, guias, diretorio, extensoes,
+                                                                       nomes_limpos[nome_arquivo])
+
+    caminhos = []
+    for nome in sorted(indices):
+        if nome not in caminhos_por_origem:
+            caminhos_por_origem[nome] = [os.path.join(diretorio, arquivo) for arquivo in anterior.arquivos(nome)]
+        manifesto.registrar(nome, impressoes[nome], caminhos_por_origem[nome])
+        caminhos += caminhos_por_origem[nome]
+
+    # Arquivos de origens que saíram da planilha ou mudaram de nome (e não foram reescritos por outra)
+    atuais = {os.path.basename(c) for c in caminhos}
+    for nome in anterior.origens:
+        for arquivo in anterior.arquivos(nome):
+            if arquivo not in atuais and os.path.exists(os.path.join(diretorio, arquivo)):
+                os.remove(os.path.join(diretorio, arquivo))
+    manifesto.gravar()
+    return caminhos
+
+
+def _comprimir_e_validar(documento, nivel, nome, validar):
+    """(crc, tamanho, bytes comprimidos, erros do XSD ou None)."""
+    with etapa("geracao.compressao", origem=nome) as medicao:
+        comprimido = comprimir(documento, nivel)
+        medicao.bytes = comprimido[1]
+    erros = validar_xte(documento, nome) if validar else None
+    return comprimido + (erros,)
+
+
+def _gerar_origem(df_origem, agora, nivel, validar=False):
+    """Executado em um processo filho: gera, comprime e (opcionalmente) valida uma única origem.
+
+    Devolve (nome base, crc, tamanho, bytes comprimidos, erros do XSD, medições do processo filho).
+    """
+    with coletar() as registros:
+        geracao = GeracaoXTE(df_origem, agora=agora)
+        (nome_arquivo, guias), = geracao.blocos
+        saida = io.BytesIO()
+        geracao.escrever(saida, guias, nome=nome_arquivo)
+        resultado = _comprimir_e_validar(saida.getvalue(), nivel, nome_arquivo, validar)
+    return (nome_arquivo_saida(nome_arquivo),) + resultado + (registros,)
+
+
+def gerar_xte_em_zips(excel_file, destinos, ao_concluir=None, nivel=NIVEL_COMPRESSAO, max_workers=None, processos=None,
+                      ao_validar=None, ao_problemas=None):
+    """Gera os arquivos de cada origem direto em ZIPs comprimidos no disco.
+
+    `destinos` é {extensão: caminho do .zip}, por exemplo {".xml": ..., ".xte": ...}.
+    Cada documento é gerado e comprimido uma única vez e os mesmos bytes comprimidos
+    entram em todos os ZIPs. `ao_concluir(concluidos, total, nome)` é chamado a cada
+    arquivo pronto. Devolve (nomes base na ordem de geração, bytes do primeiro
+    documento como exemplo); nomes base repetidos ganham o sufixo _2, _3...
+
+    Com `processos` > 1 (padrão: XTE_PROCESSOS ou nº de CPUs) cada origem é gerada em
+    um processo separado; senão a geração é sequencial e só a compressão roda em threads.
+
+    Com `ao_validar(nome, erros)`, cada documento também é validado contra o XSD do
+    TISS junto com a compressão, e a lista de ErroXSD (vazia = válido) é informada.
+    `ao_problemas` é repassado a `ler_planilha_por_origem`.
+    """
+    validar = ao_validar is not None
+    if validar:
+        # Compilado antes dos processos filhos, que herdam o schema pelo fork
+        carregar_esquema()
+    planilha = ler_planilha_por_origem(excel_file, ao_problemas)
+    zips = {extensao: PacoteZip(caminho) for extensao, caminho in destinos.items()}
+    nomes = []
+    usados = set()
+
+    def gravar(nome_limpo, crc, tamanho, comprimido, erros):
+        nome_limpo = nome_unico(nome_limpo, usados)
+        for extensao, zf in zips.items():
+            zf.adicionar(f"{nome_limpo}{extensao}", crc, tamanho, comprimido)
+        nomes.append(nome_limpo)
+        if validar:
+            ao_validar(nome_limpo, erros)
+
+    with etapa("geracao.zip") as medicao:
+        medicao.linhas = planilha.linhas
+        try:
+            total = len(planilha)
+            processos = numero_de_processos(total, processos)
+            medicao.contexto["processos"] = processos
+            if processos > 1:
+                exemplo = _gerar_em_processos(planilha, processos, nivel, total, gravar, ao_concluir, validar)
+            else:
+                exemplo = _gerar_em_sequencia(planilha.dataframe(), max_workers, nivel, total, gravar, ao_concluir, validar)
+        finally:
+            for zf in zips.values():
+                zf.fechar()
+        medicao.bytes = sum(os.path.getsize(caminho) for caminho in destinos.values())
+    return nomes, exemplo
+
+
+def _gerar_em_sequencia(df, max_workers, nivel, total, gravar, ao_concluir, validar=False):
+    # A compressão (e a validação, que também libera o GIL) roda em threads enquanto a próxima origem é gerada
+    geracao = GeracaoXTE(df)
+    max_workers = max_workers or min(4, os.cpu_count() or 1)
+    exemplo = None
+    pendentes = deque()
+    concluidos = 0
+
+    def gravar_proximo():
+        nonlocal concluidos
+        nome_limpo, futuro = pendentes.popleft()
+        gravar(nome_limpo, *futuro.result())
+        concluidos += 1
+        if ao_concluir:
+            ao_concluir(concluidos, total, nome_limpo)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for nome_arquivo, guias in geracao.blocos:
+            saida = io.BytesIO()
+            geracao.escrever(saida, guias, nome=nome_arquivo)
+            documento = saida.getvalue()
+            del saida
+            if exemplo is None:
+                exemplo = documento
+            pendentes.append((nome_arquivo_saida(nome_arquivo),
+                              executor.submit(_comprimir_e_validar, documento, nivel, nome_arquivo, validar)))
+            del documento
+            # Poucos documentos aguardando compressão por vez, para a memória não crescer
+            while len(pendentes) > 2 * max_workers:
+                gravar_proximo()
+        while pendentes:
+            gravar_proximo()
+    return exemplo
+
+
+def _gerar_em_processos(planilha, processos, nivel, total, gravar, ao_concluir, validar=False):
+    # Data/hora fixadas aqui para todos os arquivos terem o mesmo registro e numeroLote
+    agora = agora_no_fuso()
+    origens = planilha.iterar_origens()
+    prontos = {}
+    proximo = 0
+    concluidos = 0
+    exemplo = None
+    executor = ProcessPoolExecutor(max_workers=processos, mp_context=contexto_multiprocessing())
+    try:
+        futuros = {}
+        enviados = 0
+        esgotado = False
+        while futuros or not esgotado:
+            # Poucas origens enviadas por vez: cada fatia só é serializada quando há processo livre
+            while not esgotado and len(futuros) < 2 * processos:
+                df_origem = next(origens, None)
+                if df_origem is None:
+                    esgotado = True
+                    break
+                futuros[executor.submit(_gerar_origem, df_origem, agora, nivel, validar)] = enviados
+                enviados += 1
+            feitos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                ordem = futuros.pop(futuro)
+                resultado = futuro.result()
+                prontos[ordem] = resultado[:-1]
+                repassar(resultado[-1])
+                concluidos += 1
+                if ao_concluir:
+                    ao_concluir(concluidos, total, prontos[ordem][0])
+            # Os ZIPs recebem os arquivos na ordem das origens, não na ordem de término
+            while proximo in prontos:
+                nome_limpo, crc, tamanho, comprimido, erros = prontos.pop(proximo)
+                if exemplo is None:
+                    exemplo = zlib.decompress(comprimido, -zlib.MAX_WBITS)
+                gravar(nome_limpo, crc, tamanho, comprimido, erros)
+                proximo += 1
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return exemplo
+
+
+def gerar_xte_do_excel(excel_file):
+    geracao = GeracaoXTE(ler_planilha_por_origem(excel_file).dataframe())
+    arquivos_gerados = {}
+    usados = set()
+    for nome_arquivo, guias in geracao.blocos:
+        saida = io.BytesIO()
+        geracao.escrever(saida, guias, nome=nome_arquivo)
+        final_pretty = saida.getvalue()
+        nome_limpo = nome_unico(nome_arquivo_saida(nome_arquivo), usados)
+        arquivos_gerados[f"{nome_limpo}.xml"] = final_pretty
+        arquivos_gerados[f"{nome_limpo}.xte"] = final_pretty
+
+    return arquivos_gerados
@@ -0,0 +1,78 @@
+import hashlib
+import xml.parsers.expat
+
+from amconsultoria.escritor_xml import ENCODING_XTE
+
+# Blocos cujo texto entra no hash do epílogo, na ordem do documento
+BLOCOS_DO_HASH = ("cabecalho", "Mensagem")
+
+
+def novo_hash():
+    return hashlib.md5()
+
+
+def atualizar_hash(md5, texto):
+    md5.update(texto.encode(ENCODING_XTE))
+
+
+def _tag_local(nome):
+    return nome.rsplit("}", 1)[-1]
+
+
+def ler_hash_xte(file):
+    """Percorre um XTE existente em streaming e devolve (hash_calculado, hash_informado).
+
+    O cálculo é o mesmo da geração: o texto de cada nó dentro de `cabecalho` e
+    `Mensagem`, sem espaços nas pontas, concatenado e passado ao MD5. O hash
+    informado é o de `epilogo/hash` (None quando o arquivo não tem epílogo).
+    """
+    md5 = novo_hash()
+    abertos = []
+    pedacos = []
+    estado = {"dentro": False, "no_hash": False, "informado": None}
+
+    def descarregar():
+        if pedacos:
+            texto = "".join(pedacos).strip()
+            pedacos.clear()
+            if estado["dentro"] and texto:
+                atualizar_hash(md5, texto)
+
+    def inicio(nome, _atributos):
+        descarregar()
+        tag = _tag_local(nome)
+        abertos.append(tag)
+        if len(abertos) == 2 and tag in BLOCOS_DO_HASH:
+            estado["dentro"] = True
+        elif tag == "hash" and len(abertos) == 3 and abertos[1] == "epilogo":
+            estado["no_hash"] = True
+
+    def fim(_nome):
+        if estado["no_hash"]:
+            estado["informado"] = "".join(pedacos).strip()
+            estado["no_hash"] = False
+        descarregar()
+        if len(abertos) == 2 and estado["dentro"]:
+            estado["dentro"] = False
+        abertos.pop()
+
+    parser = xml.parsers.expat.ParserCreate(namespace_separator="}")
+    parser.buffer_text = True
+    parser.StartElementHandler = inicio
+    parser.EndElementHandler = fim
+    parser.CharacterDataHandler = pedacos.append
+
+    file.seek(0)
+    parser.ParseFile(file)
+    return md5.hexdigest(), estado["informado"]
+
+
+def calcular_hash_xte(file):
+    """Recalcula o hash do epílogo de um XTE existente sem carregá-lo inteiro."""
+    return ler_hash_xte(file)[0]
+
+
+def verificar_hash_xte(file):
+    """Confere o `epilogo/hash` de um XTE. Devolve (valido, hash_informado, hash_calculado)."""
+    calculado, informado = ler_hash_xte(file)
+    return informado is not None and informado.lower() == calculado, informado, calculado
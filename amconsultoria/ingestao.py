@@ -0,0 +1,313 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import closing
+from itertools import chain, islice
+
+from amconsultoria.cache_parquet import chave_do_caminho, chave_do_stream
+from amconsultoria.diagnostico import coletar, etapa, repassar
+from amconsultoria.parser_xte import parse_xte
+from amconsultoria.processos import contexto_multiprocessing, numero_de_processos
+from amconsultoria.validacao_xsd import carregar_esquema, validar_xte
+
+EXTENSOES_XTE = (".xte", ".xml")
+# ZIPs dentro de ZIPs precisam de um arquivo com seek: até este tamanho ficam em
+# memória, acima disso vão para um arquivo temporário
+TAMANHO_SPOOL_ZIP = 32 << 20
+
+
+class FonteXTE:
+    """Um XTE a ser lido: arquivo enviado, caminho em disco ou membro de um ZIP.
+
+    `abrir()` devolve um stream binário novo a cada chamada. `caminho` só existe para
+    arquivos em disco, que os processos filhos abrem por conta própria.
+    """
+
+    def __init__(self, nome, abrir, caminho=None):
+        self.nome = nome
+        self.abrir = abrir
+        self.caminho = caminho
+
+
+def _conteudo_do_arquivo(file):
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+
+def _eh_zip(nome):
+    return nome.lower().endswith(".zip")
+
+
+def _copiar_para_spool(zf, info):
+    spool = tempfile.SpooledTemporaryFile(max_size=TAMANHO_SPOOL_ZIP)
+    try:
+        with zf.open(info) as membro:
+            shutil.copyfileobj(membro, spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _fontes_do_zip(arquivo, nome_zip, falhar):
+    """Entrega os XTE de um ZIP (e dos ZIPs dentro dele) sem descompactar os membros.
+
+    O nome de cada fonte é o caminho do membro prefixado pelo(s) ZIP(s) que o contêm,
+    por exemplo `lote.zip/prestador/guias.xte`. Um ZIP aninhado só é copiado para o
+    spool quando chega a vez dele e o spool é fechado assim que os seus membros
+    foram entregues: no máximo um spool por nível de aninhamento fica aberto.
+    """
+    try:
+        zf = zipfile.ZipFile(arquivo)
+    except (zipfile.BadZipFile, OSError) as erro:
+        falhar(nome_zip, erro)
+        return
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            nome = f"{nome_zip}/{info.filename}"
+            if _eh_zip(info.filename):
+                try:
+                    spool = _copiar_para_spool(zf, info)
+                except (zipfile.BadZipFile, OSError) as erro:
+                    falhar(nome, erro)
+                    continue
+                with spool:
+                    yield from _fontes_do_zip(spool, nome, falhar)
+            elif info.filename.lower().endswith(EXTENSOES_XTE):
+                yield FonteXTE(nome, lambda info=info, zf=zf: zf.open(info))
+
+
+def expandir_fontes(arquivos, falhar):
+    """Transforma arquivos enviados/caminhos (XTE ou ZIP) em FonteXTE, na ordem de envio.
+
+    As fontes são entregues sob demanda: a de um membro de ZIP só pode ser aberta até
+    a próxima ser pedida, porque o ZIP (ou o spool do ZIP aninhado) é fechado ao
+    passar para o seguinte.
+    """
+    for file in arquivos:
+        if isinstance(file, (str, os.PathLike)):
+            caminho = os.fspath(file)
+            nome = os.path.basename(caminho)
+            if _eh_zip(nome):
+                try:
+                    arquivo = open(caminho, "rb")
+                except OSError as erro:
+                    falhar(nome, erro)
+                    continue
+                with arquivo:
+                    yield from _fontes_do_zip(arquivo, nome, falhar)
+            else:
+                yield FonteXTE(nome, lambda caminho=caminho: open(caminho, "rb"), caminho=caminho)
+        elif _eh_zip(file.name):
+            file.seek(0)
+            yield from _fontes_do_zip(file, file.name, falhar)
+        else:
+            yield FonteXTE(file.name, lambda file=file: io.BytesIO(_conteudo_do_arquivo(file)))
+
+
+def _ler_xte(nome, origem, cache=None, chave=None):
+    """`origem` é um caminho (aberto aqui) ou um stream já aberto."""
+    if isinstance(origem, str):
+        with open(origem, "rb") as f:
+            df = parse_xte(f, nome=nome)
+    else:
+        df = parse_xte(origem, nome=nome)
+    if cache is not None:
+        with etapa("ingestao.cache_gravacao", arquivo=nome) as medicao:
+            medicao.linhas = len(df)
+            cache.salvar(chave, df)
+    return df
+
+
+def _validar_e_ler(nome, origem, cache=None, chave=None, validar=False):
+    """Devolve (df, erros do XSD); a validação só roda com `validar` e não impede a leitura."""
+    erros = None
+    if validar:
+        erros = validar_xte(origem, nome)
+    return _ler_xte(nome, origem, cache, chave), erros
+
+
+def _ler_xte_em_processo(nome, origem, cache=None, chave=None, validar=False):
+    # As medições feitas no processo filho voltam junto com o DataFrame
+    with coletar() as registros:
+        df, erros = _validar_e_ler(nome, origem, cache, chave, validar)
+    return df, erros, registros
+
+
+def _copiar_para_disco(fonte, diretorio, i):
+    """Copia o XTE em blocos para `diretorio` e devolve o caminho, que o processo filho abre por conta própria."""
+    caminho = os.path.join(diretorio, f"{i}.xte")
+    with fonte.abrir() as origem, open(caminho, "wb") as destino:
+        shutil.copyfileobj(origem, destino)
+    return caminho
+
+
+def _chave(fonte):
+    if fonte.caminho is not None:
+        return chave_do_caminho(fonte.caminho)
+    with fonte.abrir() as f:
+        return chave_do_stream(f)
+
+
+def ler_xtes_em_paralelo(arquivos, max_workers=None, ao_concluir=None, cache=None, ao_falhar=None, ao_validar=None):
+    """Lê vários arquivos .xte (soltos ou dentro de ZIPs, inclusive aninhados) em um pool de processos.
+
+    `arquivos` são objetos com `.name` (como os do st.file_uploader) ou caminhos em
+    disco. Devolve um DataFrame por XTE lido, na ordem de envio (membros de um ZIP
+    na ordem do ZIP), independente da ordem de término. A cada XTE concluído chama
+    `ao_concluir(concluidos, total, nome)`.
+
+    Os membros de ZIP são lidos um de cada vez, nunca todos descompactados juntos:
+    sem pool vão como stream direto para o parser; com pool, cada um é copiado em
+    blocos para um arquivo temporário, que o processo filho lê do disco (só alguns
+    aguardam um processo livre e cada arquivo é apagado quando a leitura termina). Os ZIPs também são abertos um de cada vez,
+    então o `total` informado cresce à medida que eles são expandidos. Com `ao_falhar(nome, erro)`, um XTE ou ZIP
+    com erro é informado e pulado (o resultado dele é None); sem, o erro é propagado.
+
+    Com um `cache` (CacheParquet), arquivos já lidos antes são servidos do disco e
+    só os demais vão para o pool, que grava o resultado no cache.
+
+    Com `ao_validar(nome, erros)`, cada XTE também é validado contra o XSD do TISS
+    (amconsultoria.validacao_xsd) antes da leitura, inclusive os que vêm do cache.
+    """
+    validar = ao_validar is not None
+    if validar:
+        # Compilado antes do pool: os processos filhos herdam o schema pelo fork
+        carregar_esquema()
+
+    def falhar(nome, erro):
+        if ao_falhar is None:
+            raise erro
+        ao_falhar(nome, erro)
+
+    # Os ZIPs são expandidos durante a leitura, então o total cresce à medida que eles são abertos
+    nomes = []
+    resultados = []
+    concluidos = 0
+
+    def concluir(i):
+        nonlocal concluidos
+        concluidos += 1
+        if ao_concluir:
+            ao_concluir(concluidos, len(nomes), nomes[i])
+
+    def ler_do_cache(i, fonte):
+        """(resolvida, chave): resolvida quando o XTE veio do cache ou falhou."""
+        with etapa("ingestao.cache_leitura", arquivo=fonte.nome) as medicao:
+            try:
+                chave = _chave(fonte)
+            except Exception as erro:
+                falhar(fonte.nome, erro)
+                concluir(i)
+                return True, None
+            df = cache.ler(chave, nome=fonte.nome)
+            medicao.linhas = None if df is None else len(df)
+            medicao.contexto["acerto"] = df is not None
+        if df is None:
+            return False, chave
+        if validar:
+            try:
+                with fonte.abrir() as f:
+                    ao_validar(fonte.nome, validar_xte(f, fonte.nome))
+            except Exception as erro:
+                falhar(fonte.nome, erro)
+        resultados[i] = df
+        concluir(i)
+        return True, chave
+
+    def pendentes():
+        """(i, chave, fonte) de cada XTE que não veio do cache, um de cada vez."""
+        for fonte in expandir_fontes(arquivos, falhar):
+            i = len(nomes)
+            nomes.append(fonte.nome)
+            resultados.append(None)
+            chave = None
+            if cache is not None:
+                resolvida, chave = ler_do_cache(i, fonte)
+                if resolvida:
+                    continue
+            yield i, chave, fonte
+
+    def ler_aqui(i, chave, origem):
+        try:
+            resultados[i], erros = _validar_e_ler(nomes[i], origem, cache, chave, validar)
+            if validar:
+                ao_validar(nomes[i], erros)
+        except Exception as erro:
+            falhar(nomes[i], erro)
+        concluir(i)
+
+    def carregar(i, chave, fonte, diretorio):
+        # O membro é copiado antes de a próxima fonte ser pedida (que pode fechar o ZIP dele)
+        try:
+            if fonte.caminho is not None:
+                return i, chave, fonte.caminho
+            return i, chave, _copiar_para_disco(fonte, diretorio, i)
+        except Exception as erro:
+            falhar(fonte.nome, erro)
+            concluir(i)
+            return None
+
+    def descartar(origem, diretorio):
+        if os.path.dirname(origem) == diretorio:
+            os.remove(origem)
+
+    with closing(pendentes()) as fila, tempfile.TemporaryDirectory(prefix="xte_") as diretorio:
+        if numero_de_processos(None, max_workers) == 1:
+            for i, chave, fonte in fila:
+                try:
+                    with fonte.abrir() as f:
+                        ler_aqui(i, chave, f)
+                except Exception as erro:
+                    falhar(fonte.nome, erro)
+                    concluir(i)
+            return resultados
+
+        # O pool só vale a pena a partir de dois XTE a ler
+        carregados = (item for item in (carregar(*pendente, diretorio) for pendente in fila) if item is not None)
+        primeiros = list(islice(carregados, 2))
+        if len(primeiros) < 2:
+            for item in primeiros:
+                ler_aqui(*item)
+            return resultados
+
+        processos = numero_de_processos(None, max_workers)
+        executor = ProcessPoolExecutor(max_workers=processos, mp_context=contexto_multiprocessing())
+        try:
+            futuros = {}
+            proximos = chain(primeiros, carregados)
+            esgotado = False
+            while futuros or not esgotado:
+                # Poucos arquivos aguardando por vez: cada membro só é copiado quando há processo livre
+                while not esgotado and len(futuros) < 2 * processos:
+                    proximo = next(proximos, None)
+                    if proximo is None:
+                        esgotado = True
+                        break
+                    i, chave, origem = proximo
+                    futuros[executor.submit(_ler_xte_em_processo, nomes[i], origem, cache, chave, validar)] = i, origem
+                if not futuros:
+                    continue
+                feitos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in feitos:
+                    i, origem = futuros.pop(futuro)
+                    descartar(origem, diretorio)
+                    try:
+                        resultados[i], erros, registros = futuro.result()
+                        repassar(registros)
+                        if validar:
+                            ao_validar(nomes[i], erros)
+                    except Exception as erro:
+                        falhar(nomes[i], erro)
+                    concluir(i)
+        finally:
+            executor.shutdown(cancel_futures=True)
+        return resultados
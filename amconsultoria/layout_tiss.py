@@ -0,0 +1,262 @@
+"""Layout TISS de Monitoramento: a única tabela que liga as tags do XTE às colunas.
+
+A mesma tabela é usada nas duas direções:
+
+- a geração compila `PLANO_CABECALHO` e `PLANO_GUIA` em listas de valores já
+  preparados e escreve os elementos na ordem do plano (gerador_xte);
+- a leitura compila os mesmos planos em um `ExtratorGuia`, um despacho por tag
+  que percorre cada guia uma única vez (parser_xte).
+
+Os tipos dos campos também definem o DataFrame consolidado (amconsultoria.esquema):
+um campo novo entra na leitura, na geração e nas exportações sem mexer em outro
+arquivo (na planilha, depois das colunas já conhecidas). Os nós do plano são tuplas:
+
+    campo(tag, coluna, tipo)            elemento com texto (0..1), de uma coluna
+    grupo(tag, filhos, se_presente)     elemento com filhos (0..1); com `se_presente`, só é
+                                        escrito quando alguma dessas colunas tem valor
+    escolha(alternativas)               só o primeiro campo com valor é escrito (xs:choice)
+    repetido(tag, filhos, se_presente)  um elemento por linha da guia (0..n), ex.: procedimentos
+"""
+
+NS = "http://www.ans.gov.br/padroes/tiss/schemas"
+NS_ANS = f"{{{NS}}}"
+VERSAO_TISS = "1.04.01"
+XSD_TISS = f"tissMonitoramentoV{VERSAO_TISS.replace('.', '_')}.xsd"
+
+# Tipos das colunas no DataFrame consolidado
+TEXTO = "texto"          # texto livre/identificadores únicos (object)
+CATEGORIA = "categoria"  # campos repetidos ou de baixa cardinalidade (category)
+NUMERO = "numero"        # valores monetários (float64)
+DATA = "data"            # datas do XTE (datetime64)
+
+
+def campo(tag, coluna=None, tipo=CATEGORIA):
+    return ("campo", tag, coluna or tag, tipo)
+
+
+def grupo(tag, filhos, se_presente=None):
+    return ("grupo", tag, filhos, se_presente)
+
+
+def escolha(*alternativas):
+    return ("escolha", None, list(alternativas), None)
+
+
+def repetido(tag, filhos, se_presente=None):
+    return ("repetido", tag, filhos, se_presente)
+
+
+# Campos do cabeçalho: numeroLote, data e hora são calculados na geração
+PLANO_CABECALHO = [
+    grupo("identificacaoTransacao", [
+        campo("tipoTransacao"),
+        campo("numeroLote"),
+        campo("competenciaLote"),
+        campo("dataRegistroTransacao", "dataRegistroTransacao_cabecalho", tipo=DATA),
+        campo("horaRegistroTransacao", "horaRegistroTransacao_cabecalho"),
+    ]),
+    campo("registroANS", "registroANS_cabecalho"),
+    campo("versaoPadrao", "versaoPadrao_cabecalho"),
+]
+
+PLANO_GUIA = [
+    campo("tipoRegistro"),
+    campo("versaoTISSPrestador"),
+    campo("formaEnvio"),
+    grupo("dadosContratadoExecutante", [
+        campo("CNES"),
+        campo("identificadorExecutante"),
+        campo("codigoCNPJ_CPF"),
+        campo("municipioExecutante"),
+    ]),
+    campo("registroANSOperadoraIntermediaria"),
+    campo("tipoAtendimentoOperadoraIntermediaria"),
+    grupo("dadosBeneficiario", [
+        grupo("identBeneficiario", [
+            campo("numeroCartaoNacionalSaude", tipo=TEXTO),
+            campo("cpfBeneficiario", tipo=TEXTO),
+            campo("sexo"),
+            campo("dataNascimento", tipo=DATA),
+            campo("municipioResidencia"),
+        ]),
+        campo("numeroRegistroPlano"),
+    ]),
+    campo("tipoEventoAtencao"),
+    campo("origemEventoAtencao"),
+    campo("numeroGuia_prestador", tipo=TEXTO),
+    campo("numeroGuia_operadora", tipo=TEXTO),
+    campo("identificacaoReembolso", tipo=TEXTO),
+    grupo("formasRemuneracao", [
+        campo("formaRemuneracao"),
+        campo("valorRemuneracao", tipo=NUMERO),
+    ], se_presente=["formaRemuneracao", "valorRemuneracao"]),
+    campo("guiaSolicitacaoInternacao", tipo=TEXTO),
+    campo("dataSolicitacao", tipo=DATA),
+    campo("numeroGuiaSPSADTPrincipal", tipo=TEXTO),
+    campo("dataAutorizacao", tipo=DATA),
+    campo("dataRealizacao", tipo=DATA),
+    campo("dataInicialFaturamento", tipo=DATA),
+    campo("dataFimPeriodo", tipo=DATA),
+    campo("dataProtocoloCobranca", tipo=DATA),
+    campo("dataPagamento", tipo=DATA),
+    campo("dataProcessamentoGuia", tipo=DATA),
+    campo("tipoConsulta"),
+    campo("cboExecutante"),
+    campo("indicacaoRecemNato"),
+    campo("indicacaoAcidente"),
+    campo("caraterAtendimento"),
+    campo("tipoInternacao"),
+    campo("regimeInternacao"),
+    grupo("diagnosticosCID10", [
+        campo("diagnosticoCID"),
+    ], se_presente=["diagnosticoCID"]),
+    campo("tipoAtendimento"),
+    campo("regimeAtendimento"),
+    campo("tipoFaturamento"),
+    campo("diariasAcompanhante"),
+    campo("diariasUTI"),
+    campo("motivoSaida"),
+    grupo("valoresGuia", [
+        campo("valorTotalInformado", tipo=NUMERO),
+        campo("valorProcessado", tipo=NUMERO),
+        campo("valorTotalPagoProcedimentos", tipo=NUMERO),
+        campo("valorTotalDiarias", tipo=NUMERO),
+        campo("valorTotalTaxas", tipo=NUMERO),
+        campo("valorTotalMateriais", tipo=NUMERO),
+        campo("valorTotalOPME", tipo=NUMERO),
+        campo("valorTotalMedicamentos", tipo=NUMERO),
+        campo("valorGlosaGuia", tipo=NUMERO),
+        campo("valorPagoGuia", tipo=NUMERO),
+        campo("valorPagoFornecedores", tipo=NUMERO),
+        campo("valorTotalTabelaPropria", tipo=NUMERO),
+        campo("valorTotalCoParticipacao", tipo=NUMERO),
+    ]),
+    campo("declaracaoNascido", tipo=TEXTO),
+    campo("declaracaoObito", tipo=TEXTO),
+    repetido("procedimentos", [
+        grupo("identProcedimento", [
+            campo("codigoTabela"),
+            grupo("Procedimento", [
+                escolha(campo("grupoProcedimento"), campo("codigoProcedimento")),
+            ]),
+        ]),
+        # Quantidades ficam com o texto do XTE: "3.00" volta igual para a planilha e para o XTE
+        campo("quantidadeInformada"),
+        campo("valorInformado", "valorInformado_proc", tipo=NUMERO),
+        campo("quantidadePaga"),
+        campo("unidadeMedida"),
+        campo("valorPagoProc", tipo=NUMERO),
+        campo("valorPagoFornecedor", "valorPagoFornecedor_proc", tipo=NUMERO),
+        campo("valorCoParticipacao", tipo=NUMERO),
+    ], se_presente=["codigoProcedimento", "grupoProcedimento"]),
+]
+
+
+def colunas_do_plano(plano):
+    """Todas as colunas lidas pelo plano, inclusive as que só decidem a presença de um grupo."""
+    colunas = set()
+    for tipo, _, conteudo, se_presente in plano:
+        if tipo == "campo":
+            colunas.add(conteudo)
+        else:
+            colunas |= colunas_do_plano(conteudo)
+            colunas |= set(se_presente or ())
+    return colunas
+
+
+def tipos_do_plano(plano):
+    """{coluna: tipo} dos campos do plano, na ordem do XML."""
+    tipos = {}
+    for item in plano:
+        if item[0] == "campo":
+            tipos[item[2]] = item[3]
+        else:
+            tipos.update(tipos_do_plano(item[2]))
+    return tipos
+
+
+def colunas_data(*planos):
+    return {coluna for plano in planos for coluna, tipo in tipos_do_plano(plano).items() if tipo == DATA}
+
+
+def _despacho(plano, campos, repetidos):
+    """Preenche {tag com namespace: coluna} do escopo atual e {tag: plano} dos repetidos."""
+    for tipo, tag, conteudo, _ in plano:
+        if tipo == "campo":
+            chave = NS_ANS + tag
+            if chave in campos:
+                raise ValueError(f"Tag {tag} aparece duas vezes no mesmo escopo do layout TISS.")
+            campos[chave] = conteudo
+        elif tipo == "repetido":
+            repetidos[NS_ANS + tag] = conteudo
+        else:
+            _despacho(conteudo, campos, repetidos)
+
+
+class ExtratorGuia:
+    """Leitura de uma guiaMonitoramento compilada a partir do plano: uma passada, sem buscas.
+
+    Cada tag é procurada em um dict do escopo atual (guia ou procedimento). Na guia o
+    texto vai como está (None quando vazio); nos procedimentos, sem espaços nas pontas
+    e '' quando o elemento falta. Tags fora do layout são ignoradas.
+    """
+
+    def __init__(self, plano=PLANO_GUIA):
+        self.campos = {}
+        repetidos = {}
+        _despacho(plano, self.campos, repetidos)
+        if len(repetidos) > 1:
+            raise ValueError("O layout TISS só suporta um elemento repetido por guia.")
+        (self.tag_repetido, plano_repetido), = repetidos.items()
+        self.campos_repetido = {}
+        aninhados = {}
+        _despacho(plano_repetido, self.campos_repetido, aninhados)
+        if aninhados:
+            raise ValueError("Elementos repetidos dentro de procedimentos não são suportados.")
+        self.vazio_repetido = dict.fromkeys(self.campos_repetido.values(), "")
+
+    def _percorrer_guia(self, elem, dados, repetidos):
+        campos = self.campos
+        for filho in elem:
+            tag = filho.tag
+            coluna = campos.get(tag)
+            if coluna is not None:
+                dados[coluna] = filho.text or None
+            elif tag == self.tag_repetido:
+                item = self.vazio_repetido.copy()
+                self._percorrer_repetido(filho, item)
+                repetidos.append(item)
+            elif len(filho):
+                self._percorrer_guia(filho, dados, repetidos)
+
+    def _percorrer_repetido(self, elem, item):
+        campos = self.campos_repetido
+        for filho in elem:
+            coluna = campos.get(filho.tag)
+            if coluna is not None:
+                item[coluna] = (filho.text or "").strip()
+            elif len(filho):
+                self._percorrer_repetido(filho, item)
+
+    def linhas(self, guia):
+        """Linhas da guia: uma por procedimento (com os campos da guia repetidos) ou uma só, sem procedimentos."""
+        dados = {}
+        repetidos = []
+        self._percorrer_guia(guia, dados, repetidos)
+        if not repetidos:
+            return [dados]
+        for item in repetidos:
+            item.update((coluna, valor) for coluna, valor in dados.items() if coluna not in item)
+        return repetidos
+
+
+def ler_cabecalho(cabecalho, plano=PLANO_CABECALHO):
+    """{coluna: texto} do cabeçalho pelo plano; campos ausentes ficam ''."""
+    campos = {}
+    _despacho(plano, campos, {})
+    valores = dict.fromkeys(campos.values(), "")
+    for elem in cabecalho.iter():
+        coluna = campos.get(elem.tag)
+        if coluna is not None:
+            valores[coluna] = elem.text or ""
+    return valores
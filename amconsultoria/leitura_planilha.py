@@ -0,0 +1,232 @@
+import os
+from collections import namedtuple
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# Linhas por bloco lido: a planilha nunca é montada inteira antes de ser separada por origem
+TAMANHO_BLOCO_PLANILHA = 100_000
+# Problemas guardados para exibição; acima disso só a contagem continua
+LIMITE_PROBLEMAS = 1000
+COLUNA_ORIGEM = "Nome da Origem"
+
+ProblemaPlanilha = namedtuple("ProblemaPlanilha", ["linha", "coluna", "valor", "mensagem"])
+
+
+def _nome_do_arquivo(arquivo):
+    if isinstance(arquivo, (str, os.PathLike)):
+        return os.fspath(arquivo)
+    return getattr(arquivo, "name", "")
+
+
+def _exigir_colunas(colunas, obrigatorias):
+    for coluna in obrigatorias:
+        if coluna not in colunas:
+            raise ValueError(f"A coluna '{coluna}' é obrigatória no Excel.")
+
+
+def _blocos_csv(arquivo, colunas, obrigatorias, tamanho_bloco):
+    # Só o cabeçalho primeiro, para recusar a planilha antes de ler o resto
+    cabecalho = pd.read_csv(arquivo, dtype=str, sep=";", nrows=0).columns
+    _exigir_colunas(cabecalho, obrigatorias)
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    usecols = None if colunas is None else [nome for nome in cabecalho if nome in colunas]
+    entregues = 0
+    with pd.read_csv(arquivo, dtype=str, sep=";", usecols=usecols, chunksize=tamanho_bloco) as leitor:
+        for bloco in leitor:
+            # Índice = linha do arquivo (o cabeçalho é a linha 1)
+            bloco.index = bloco.index + 2
+            entregues += 1
+            yield bloco
+    if not entregues:
+        yield pd.DataFrame({nome: pd.Series(dtype=object) for nome in cabecalho if colunas is None or nome in colunas})
+
+
+def _converter_celula(celula, tipo_erro, tipo_numerico):
+    # Mesma conversão do pd.read_excel (engine openpyxl), para o texto final não mudar
+    valor = celula.value
+    if valor is None:
+        return ""
+    if celula.data_type == tipo_erro:
+        return float("nan")
+    if celula.data_type == tipo_numerico:
+        inteiro = int(valor)
+        return inteiro if inteiro == valor else float(valor)
+    return valor
+
+
+def _blocos_xlsx(arquivo, colunas, obrigatorias, tamanho_bloco):
+    from openpyxl import load_workbook
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    # Modo read-only: as linhas vêm do XML da planilha uma a uma, sem carregar o arquivo todo
+    livro = load_workbook(arquivo, read_only=True, data_only=True, keep_links=False)
+    try:
+        planilha = livro.worksheets[0]
+        planilha.reset_dimensions()
+        linhas = planilha.rows
+        cabecalho = []
+        for linha in linhas:
+            cabecalho = [_converter_celula(c, TYPE_ERROR, TYPE_NUMERIC) for c in linha]
+            while cabecalho and cabecalho[-1] == "":
+                cabecalho.pop()
+            if cabecalho:
+                break
+        # Nomes como o pandas monta (duplicadas viram "col.1", vazias "Unnamed: n")
+        nomes = list(TextParser([cabecalho], header=0, dtype=str).read().columns) if cabecalho else []
+        _exigir_colunas(nomes, obrigatorias)
+        posicoes = [j for j, nome in enumerate(nomes) if colunas is None or nome in colunas]
+        selecionadas = [nomes[j] for j in posicoes]
+
+        valores = []
+        numeros = []
+        entregues = 0
+        for linha in linhas:
+            convertida = [_converter_celula(linha[j], TYPE_ERROR, TYPE_NUMERIC) if j < len(linha) else "" for j in posicoes]
+            # Linhas em branco (nas colunas lidas) não vão para a geração
+            if all(valor == "" for valor in convertida):
+                continue
+            valores.append(convertida)
+            # Células vazias do modo read-only não sabem a própria linha
+            numeros.append(next(c.row for c in linha if getattr(c, "row", None)))
+            if len(valores) >= tamanho_bloco:
+                yield _bloco_xlsx(valores, numeros, selecionadas)
+                entregues += 1
+                valores, numeros = [], []
+        if valores or not entregues:
+            yield _bloco_xlsx(valores, numeros, selecionadas)
+    finally:
+        livro.close()
+
+
+def _bloco_xlsx(valores, numeros, nomes):
+    if not valores:
+        return pd.DataFrame({nome: pd.Series(dtype=object) for nome in nomes})
+    bloco = TextParser(valores, names=nomes, header=None, dtype=str).read()
+    bloco.index = pd.Index(numeros)
+    return bloco
+
+
+def blocos_da_planilha(arquivo, colunas=None, obrigatorias=(COLUNA_ORIGEM,), tamanho_bloco=TAMANHO_BLOCO_PLANILHA):
+    """Lê o Excel/CSV (objeto com `.name` ou caminho) em blocos de DataFrame, tudo como texto.
+
+    Só as `colunas` pedidas são guardadas (todas, quando None), e o índice de cada
+    bloco é o número da linha na planilha. As `obrigatorias` são conferidas no
+    cabeçalho, antes de qualquer linha ser lida (ValueError quando faltam).
+    """
+    if _nome_do_arquivo(arquivo).lower().endswith(".csv"):
+        return _blocos_csv(arquivo, colunas, obrigatorias, tamanho_bloco)
+    return _blocos_xlsx(arquivo, colunas, obrigatorias, tamanho_bloco)
+
+
+def _datas_invalidas(textos):
+    validas = (pd.to_datetime(textos, format="%d/%m/%Y", errors="coerce").notna()
+               | pd.to_datetime(textos, format="%Y-%m-%d", errors="coerce").notna())
+    return ~validas.to_numpy()
+
+
+def _numeros_invalidos(textos):
+    return pd.to_numeric(textos, errors="coerce").isna().to_numpy()
+
+
+def _valores_invalidos(serie, invalidos):
+    """Linhas de `serie` cujo texto é rejeitado por `invalidos`, conferindo cada valor distinto uma vez só."""
+    distintos = pd.Series(serie.dropna().unique(), dtype=object)
+    limpos = distintos.str.strip()
+    preenchidos = (limpos != "").to_numpy()
+    rejeitados = distintos[preenchidos][invalidos(limpos[preenchidos])]
+    if rejeitados.empty:
+        return serie.iloc[:0]
+    return serie[serie.isin(rejeitados)]
+
+
+def _validar_bloco(bloco, colunas_data, colunas_numericas):
+    problemas = []
+    if COLUNA_ORIGEM in bloco.columns:
+        sem_origem = bloco[COLUNA_ORIGEM].isna()
+        if sem_origem.any():
+            com_dados = bloco[sem_origem].drop(columns=COLUNA_ORIGEM).notna().any(axis=1)
+            for linha in com_dados.index[com_dados]:
+                problemas.append(ProblemaPlanilha(int(linha), COLUNA_ORIGEM, None, "linha sem Nome da Origem, ignorada na geração"))
+    verificacoes = [(coluna, _datas_invalidas, "data fora dos formatos dd/mm/aaaa ou aaaa-mm-dd") for coluna in colunas_data]
+    verificacoes += [(coluna, _numeros_invalidos, "valor numérico inválido (use ponto como separador decimal)")
+                     for coluna in colunas_numericas]
+    for coluna, invalidos, mensagem in verificacoes:
+        if coluna not in bloco.columns:
+            continue
+        for linha, valor in _valores_invalidos(bloco[coluna], invalidos).items():
+            problemas.append(ProblemaPlanilha(int(linha), coluna, valor, mensagem))
+    problemas.sort(key=lambda problema: problema.linha)
+    return problemas
+
+
+class PlanilhaPorOrigem:
+    """Linhas da planilha separadas por Nome da Origem à medida que os blocos são lidos.
+
+    Cada origem guarda as suas fatias na ordem da planilha; o DataFrame de uma origem
+    só é montado quando pedido. `problemas` traz até LIMITE_PROBLEMAS problemas
+    encontrados na leitura e `total_problemas` a contagem completa.
+    """
+
+    def __init__(self, colunas):
+        self.colunas = list(colunas)
+        self.linhas = 0
+        self.problemas = []
+        self.total_problemas = 0
+        self._partes = {}
+
+    def adicionar(self, bloco):
+        self.linhas += len(bloco)
+        if not self.colunas:
+            self.colunas = list(bloco.columns)
+        for nome, posicoes in bloco.groupby(COLUNA_ORIGEM, sort=False).indices.items():
+            self._partes.setdefault(nome, []).append(bloco.iloc[posicoes])
+
+    def registrar_problemas(self, problemas):
+        self.total_problemas += len(problemas)
+        espaco = LIMITE_PROBLEMAS - len(self.problemas)
+        if espaco > 0:
+            self.problemas += problemas[:espaco]
+
+    @property
+    def origens(self):
+        return sorted(self._partes)
+
+    def __len__(self):
+        return len(self._partes)
+
+    def origem(self, nome):
+        partes = self._partes[nome]
+        return partes[0] if len(partes) == 1 else pd.concat(partes)
+
+    def iterar_origens(self):
+        """Entrega o DataFrame de cada origem, em ordem de nome, liberando as fatias já entregues."""
+        for nome in self.origens:
+            df = self.origem(nome)
+            del self._partes[nome]
+            yield df
+
+    def dataframe(self):
+        """Todas as origens em um único DataFrame (agrupadas por origem, na ordem da planilha dentro de cada uma)."""
+        partes = [parte for nome in self.origens for parte in self._partes[nome]]
+        if not partes:
+            return pd.DataFrame(columns=self.colunas, dtype=object)
+        return pd.concat(partes)
+
+
+def ler_por_origem(arquivo, colunas=None, colunas_data=(), colunas_numericas=(), tamanho_bloco=TAMANHO_BLOCO_PLANILHA):
+    """Lê a planilha em blocos e já separa as linhas por Nome da Origem (PlanilhaPorOrigem).
+
+    Cada bloco é validado ao chegar: linhas com dados mas sem Nome da Origem, datas
+    em `colunas_data` que a geração não sabe converter e textos em `colunas_numericas`
+    que não são números viram ProblemaPlanilha. A falta da coluna Nome da Origem
+    interrompe a leitura com ValueError.
+    """
+    planilha = None
+    for bloco in blocos_da_planilha(arquivo, colunas, tamanho_bloco=tamanho_bloco):
+        if planilha is None:
+            planilha = PlanilhaPorOrigem(bloco.columns)
+        planilha.registrar_problemas(_validar_bloco(bloco, colunas_data, colunas_numericas))
+        planilha.adicionar(bloco)
+    return planilha if planilha is not None else PlanilhaPorOrigem([])
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+NOME_MANIFESTO = ".manifesto_xte.json"
+
+
+def impressoes_por_origem(df, colunas, indices):
+    """Impressão digital (SHA-256) das linhas de cada origem, restrita às `colunas` usadas na geração.
+
+    `indices` é {Nome da Origem: posições das linhas}, como o `groupby(...).indices`.
+    Cada linha vira um hash de 64 bits das suas células, calculado de uma vez para
+    a planilha inteira; a impressão da origem é o SHA-256 desses hashes na ordem da
+    planilha, então editar, incluir, remover ou reordenar linhas muda a impressão,
+    mas mexer em outra origem ou em colunas que a geração ignora não.
+    """
+    colunas = sorted(colunas)
+    hashes_linhas = pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+    prefixo = json.dumps(colunas).encode("utf-8")
+    impressoes = {}
+    for nome, posicoes in indices.items():
+        sha256 = hashlib.sha256(prefixo)
+        sha256.update(hashes_linhas[posicoes].tobytes())
+        impressoes[nome] = sha256.hexdigest()
+    return impressoes
+
+
+class ManifestoGeracao:
+    """Manifesto gravado junto dos arquivos gerados em um diretório.
+
+    Guarda, por Nome da Origem, a impressão das linhas que geraram o arquivo e o
+    tamanho de cada arquivo escrito. Só vale para a mesma versão do gerador e as
+    mesmas extensões; qualquer diferença descarta o manifesto inteiro.
+    """
+
+    def __init__(self, diretorio, versao, extensoes):
+        self.caminho = os.path.join(diretorio, NOME_MANIFESTO)
+        self.diretorio = diretorio
+        self.versao = versao
+        self.extensoes = list(extensoes)
+        self.origens = {}
+
+    @classmethod
+    def carregar(cls, diretorio, versao, extensoes):
+        manifesto = cls(diretorio, versao, extensoes)
+        try:
+            with open(manifesto.caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except (FileNotFoundError, ValueError, OSError):
+            return manifesto
+        if (isinstance(dados, dict) and dados.get("versao_gerador") == versao
+                and dados.get("extensoes") == manifesto.extensoes and isinstance(dados.get("origens"), dict)):
+            manifesto.origens = dados["origens"]
+        return manifesto
+
+    def reaproveitavel(self, nome_origem, impressao):
+        """True quando a origem não mudou e os arquivos dela seguem no disco com o tamanho gravado."""
+        entrada = self.origens.get(nome_origem)
+        if not entrada or entrada.get("impressao") != impressao:
+            return False
+        for nome, tamanho in entrada.get("arquivos", {}).items():
+            try:
+                if os.path.getsize(os.path.join(self.diretorio, nome)) != tamanho:
+                    return False
+            except OSError:
+                return False
+        return bool(entrada.get("arquivos"))
+
+    def arquivos(self, nome_origem):
+        return list(self.origens.get(nome_origem, {}).get("arquivos", {}))
+
+    def registrar(self, nome_origem, impressao, caminhos):
+        self.origens[nome_origem] = {
+            "impressao": impressao,
+            "arquivos": {os.path.basename(c): os.path.getsize(c) for c in caminhos},
+        }
+
+    def gravar(self):
+        dados = {"versao_gerador": self.versao, "extensoes": self.extensoes, "origens": self.origens}
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False, indent=1)
+            os.replace(temporario, self.caminho)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
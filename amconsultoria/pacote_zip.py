@@ -0,0 +1,125 @@
+import struct
+import time
+import zlib
+
+NIVEL_COMPRESSAO = 6
+
+# Formato ZIP (APPNOTE da PKWARE), só o necessário para entradas deflate já comprimidas
+_CABECALHO_LOCAL = struct.Struct("<4s5H3L2H")
+_CABECALHO_CENTRAL = struct.Struct("<4s6H3L5H2L")
+_FIM_CENTRAL = struct.Struct("<4s4H2LH")
+_FIM_CENTRAL64 = struct.Struct("<4sQ2H2L4Q")
+_LOCALIZADOR64 = struct.Struct("<4sLQL")
+_EXTRA64 = 0x0001
+_VERSAO = 20
+_VERSAO64 = 45
+_CRIADO_EM_UNIX = 3 << 8
+_DEFLATE = 8
+_NOME_UTF8 = 0x800
+# Como o zipfile: acima disso usa ZIP64 (alguns leitores tratam os campos de 32 bits como com sinal)
+LIMITE_ZIP64 = (1 << 31) - 1
+LIMITE_ENTRADAS = 0xFFFF
+
+
+def comprimir(dados, nivel=NIVEL_COMPRESSAO):
+    """Comprime `dados` em deflate puro (o formato das entradas ZIP_DEFLATED).
+
+    Devolve (crc32, tamanho original, bytes comprimidos). O zlib libera o GIL, então
+    várias chamadas podem rodar em threads ao mesmo tempo.
+    """
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    comprimido = compressor.compress(dados) + compressor.flush()
+    return zlib.crc32(dados), len(dados), comprimido
+
+
+def _data_hora_dos(instante):
+    ano, mes, dia, hora, minuto, segundo = instante[:6]
+    return ((ano - 1980) << 9) | (mes << 5) | dia, (hora << 11) | (minuto << 5) | (segundo // 2)
+
+
+class PacoteZip:
+    """ZIP gravado em disco só com entradas já comprimidas por `comprimir`.
+
+    Os mesmos bytes comprimidos podem ir para vários ZIPs sem comprimir de novo. O
+    zipfile não tem API pública para gravar deflate pronto, então os cabeçalhos e o
+    diretório central são escritos aqui (com ZIP64 quando os tamanhos, as posições ou
+    a quantidade de entradas passam dos limites do ZIP clássico). Nome repetido é
+    ValueError, em vez da entrada duplicada que o zipfile aceita só com um aviso.
+    """
+
+    def __init__(self, caminho):
+        self.arquivo = open(caminho, "wb")
+        self.entradas = []
+        self.nomes = set()
+
+    def adicionar(self, nome, crc, tamanho, comprimido):
+        if self.arquivo is None:
+            raise ValueError("O ZIP já foi fechado.")
+        if nome in self.nomes:
+            raise ValueError(f"Entrada duplicada no ZIP: {nome}")
+        try:
+            nome_bytes = nome.encode("ascii")
+            flags = 0
+        except UnicodeEncodeError:
+            nome_bytes = nome.encode("utf-8")
+            flags = _NOME_UTF8
+        data, hora = _data_hora_dos(time.localtime())
+        posicao = self.arquivo.tell()
+        zip64 = tamanho > LIMITE_ZIP64 or len(comprimido) > LIMITE_ZIP64
+        if zip64:
+            extra = struct.pack("<2H2Q", _EXTRA64, 16, tamanho, len(comprimido))
+            tamanhos = (0xFFFFFFFF, 0xFFFFFFFF)
+        else:
+            extra = b""
+            tamanhos = (len(comprimido), tamanho)
+        self.arquivo.write(_CABECALHO_LOCAL.pack(
+            b"PK\x03\x04", _VERSAO64 if zip64 else _VERSAO, flags, _DEFLATE, hora, data, crc, *tamanhos,
+            len(nome_bytes), len(extra)))
+        self.arquivo.write(nome_bytes)
+        self.arquivo.write(extra)
+        self.arquivo.write(comprimido)
+        self.nomes.add(nome)
+        self.entradas.append((nome_bytes, flags, data, hora, crc, len(comprimido), tamanho, posicao))
+
+    def _escrever_central(self, entrada):
+        nome_bytes, flags, data, hora, crc, tamanho_comprimido, tamanho, posicao = entrada
+        # No diretório central o extra ZIP64 leva só os campos que não couberam, nesta ordem
+        grandes = [valor for valor in (tamanho, tamanho_comprimido, posicao) if valor > LIMITE_ZIP64]
+        extra = struct.pack(f"<2H{len(grandes)}Q", _EXTRA64, 8 * len(grandes), *grandes) if grandes else b""
+        versao = _VERSAO64 if grandes else _VERSAO
+        self.arquivo.write(_CABECALHO_CENTRAL.pack(
+            b"PK\x01\x02", _CRIADO_EM_UNIX | versao, versao, flags, _DEFLATE, hora, data, crc,
+            tamanho_comprimido if tamanho_comprimido <= LIMITE_ZIP64 else 0xFFFFFFFF,
+            tamanho if tamanho <= LIMITE_ZIP64 else 0xFFFFFFFF,
+            len(nome_bytes), len(extra), 0, 0, 0, 0o644 << 16,
+            posicao if posicao <= LIMITE_ZIP64 else 0xFFFFFFFF))
+        self.arquivo.write(nome_bytes)
+        self.arquivo.write(extra)
+
+    def fechar(self):
+        """Escreve o diretório central e fecha o arquivo (pode ser chamado mais de uma vez)."""
+        if self.arquivo is None:
+            return
+        try:
+            inicio = self.arquivo.tell()
+            for entrada in self.entradas:
+                self._escrever_central(entrada)
+            fim = self.arquivo.tell()
+            quantidade, tamanho = len(self.entradas), fim - inicio
+            if quantidade > LIMITE_ENTRADAS or inicio > LIMITE_ZIP64 or tamanho > LIMITE_ZIP64:
+                self.arquivo.write(_FIM_CENTRAL64.pack(
+                    b"PK\x06\x06", _FIM_CENTRAL64.size - 12, _CRIADO_EM_UNIX | _VERSAO64, _VERSAO64, 0, 0,
+                    quantidade, quantidade, tamanho, inicio))
+                self.arquivo.write(_LOCALIZADOR64.pack(b"PK\x06\x07", 0, fim, 1))
+                # Com os campos no máximo, os leitores buscam os valores no registro ZIP64
+                quantidade, tamanho, inicio = 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF
+            self.arquivo.write(_FIM_CENTRAL.pack(b"PK\x05\x06", 0, 0, quantidade, quantidade, tamanho, inicio, 0))
+        finally:
+            self.arquivo.close()
+            self.arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
@@ -0,0 +1,160 @@
+import logging
+import time
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from amconsultoria.diagnostico import etapa, medir_pico, registrar
+from amconsultoria.esquema import aplicar_esquema, definir_origem
+from amconsultoria.layout_tiss import PLANO_CABECALHO, PLANO_GUIA, ExtratorGuia, colunas_data, ler_cabecalho
+
+logger = logging.getLogger(__name__)
+
+
+# Aumentar sempre que o DataFrame produzido mudar (invalida o cache em disco)
+VERSAO_PARSER = 7
+FORMATO_DATA_XTE = '%Y-%m-%d'
+TAMANHO_BLOCO_LEITURA = 1 << 20  # 1 MiB por leitura do arquivo enviado
+COLUNAS_DATA = colunas_data(PLANO_CABECALHO, PLANO_GUIA)
+EXEMPLOS_INVALIDOS = 5
+
+
+def _converter_datas(serie, coluna, nome):
+    """AAAA-MM-DD pelo formato fixo; o resto é lido como antes (dia primeiro) e o que não é data vai para o log."""
+    datas = pd.to_datetime(serie, format=FORMATO_DATA_XTE, errors='coerce')
+    restantes = serie[datas.isna() & serie.notna()]
+    restantes = restantes[restantes.str.strip() != ""]
+    if restantes.empty:
+        return datas
+    datas[restantes.index] = pd.to_datetime(restantes, format='mixed', dayfirst=True, errors='coerce')
+    invalidos = restantes[datas[restantes.index].isna()]
+    if not invalidos.empty:
+        exemplos = ", ".join(repr(valor) for valor in invalidos.unique()[:EXEMPLOS_INVALIDOS])
+        logger.warning("%s, coluna %s: %d valor(es) que não são data ficaram vazios (ex.: %s).",
+                       nome, coluna, len(invalidos), exemplos)
+    return datas
+
+
+def _tag_local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class _BufferColunas:
+    """Acumula linhas diretamente em listas por coluna, sem guardar um dict por linha."""
+
+    def __init__(self):
+        self.colunas = {}
+        self.total = 0
+
+    def adicionar(self, linha):
+        for chave, valor in linha.items():
+            coluna = self.colunas.get(chave)
+            if coluna is None:
+                coluna = self.colunas[chave] = [None] * self.total
+            coluna.append(valor)
+        self.total += 1
+        for coluna in self.colunas.values():
+            if len(coluna) < self.total:
+                coluna.append(None)
+
+
+def iterar_guias_xte(file, tempos=None):
+    """Percorre o arquivo em blocos e entrega (cabecalho_info, guia) a cada guiaMonitoramento lida.
+
+    Cada guia é removida da árvore logo depois de entregue, então a memória usada
+    depende do tamanho da maior guia e não do tamanho do arquivo. Se `tempos` for um
+    dict, acumula nele os segundos de 'decodificacao' e 'xml' e os 'bytes' lidos.
+    """
+    if tempos is not None:
+        tempos.setdefault('decodificacao', 0.0)
+        tempos.setdefault('xml', 0.0)
+        tempos.setdefault('bytes', 0)
+    file.seek(0)
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    abertos = []
+    cabecalho_info = {}
+    while True:
+        # ISO-8859-1 é de um byte por caractere, então cada bloco pode ser decodificado isoladamente
+        bloco = file.read(TAMANHO_BLOCO_LEITURA)
+        inicio = time.perf_counter()
+        texto = bloco.decode('iso-8859-1') if bloco else None
+        decodificado = time.perf_counter()
+        if bloco:
+            parser.feed(texto)
+        else:
+            parser.close()
+        eventos = parser.read_events()
+        if tempos is not None:
+            tempos['decodificacao'] += decodificado - inicio
+            tempos['xml'] += time.perf_counter() - decodificado
+            tempos['bytes'] += len(bloco)
+        for evento, elem in eventos:
+            if evento == 'start':
+                abertos.append(elem)
+                continue
+            abertos.pop()
+            tag = _tag_local(elem.tag)
+            if tag == 'guiaMonitoramento':
+                yield cabecalho_info, elem
+                elem.clear()
+                if abertos:
+                    abertos[-1].remove(elem)
+            elif tag == 'cabecalho':
+                cabecalho_info = ler_cabecalho(elem)
+        if not bloco:
+            break
+
+
+def parse_xte(file, nome=None):
+    nome = nome if nome is not None else file.name
+    inicio = time.perf_counter()
+    with medir_pico() as pico_total:
+        buffer = _BufferColunas()
+        cabecalho_info = {}
+        tempos = {}
+        achatamento = 0.0
+        extrator = ExtratorGuia()
+        # O XML é lido em streaming: decodificação, parse e achatamento se alternam a cada
+        # bloco, então cada um é medido pela soma dos seus trechos
+        with medir_pico() as pico_leitura:
+            for cabecalho_info, guia in iterar_guias_xte(file, tempos):
+                inicio_guia = time.perf_counter()
+                for linha in extrator.linhas(guia):
+                    buffer.adicionar(linha)
+                achatamento += time.perf_counter() - inicio_guia
+        registrar("parse.decodificacao", tempos['decodificacao'], bytes=tempos['bytes'], pico=pico_leitura, arquivo=nome)
+        registrar("parse.xml", tempos['xml'], bytes=tempos['bytes'], pico=pico_leitura, arquivo=nome)
+        registrar("parse.achatamento", achatamento, linhas=buffer.total, pico=pico_leitura, arquivo=nome)
+
+        with etapa("parse.dataframe", arquivo=nome) as medicao:
+            # O cabeçalho é igual para todas as linhas: vira uma coluna constante no final
+            for campo, valor in cabecalho_info.items():
+                if campo not in buffer.colunas:
+                    buffer.colunas[campo] = [valor] * buffer.total
+
+            df = pd.DataFrame(buffer.colunas)
+            del buffer
+            definir_origem(df, nome)
+            medicao.linhas = len(df)
+
+        with etapa("parse.datas", arquivo=nome) as medicao:
+            medicao.linhas = len(df)
+            # Datas do XTE (AAAA-MM-DD) viram datetime64 uma única vez; o texto dd/mm/AAAA
+            # só é montado na exportação
+            date_columns = [col for col in df.columns if col in COLUNAS_DATA]
+            for col in date_columns:
+                df[col] = _converter_datas(df[col], col, nome)
+
+            # Calcular idade
+            if 'dataRealizacao' in df.columns and 'dataNascimento' in df.columns:
+                df['Idade_na_Realização'] = (df['dataRealizacao'] - df['dataNascimento']).dt.days // 365
+
+        # --- BLOCO DE REMOÇÃO DE ZEROS À ESQUERDA FOI REMOVIDO DAQUI ---
+
+        # --- Tipos compactos (categorias, números) e ordem do layout; colunas vazias não são guardadas ---
+        with etapa("parse.esquema", arquivo=nome) as medicao:
+            medicao.linhas = len(df)
+            df = aplicar_esquema(df)
+    registrar("parse_xte", time.perf_counter() - inicio, linhas=len(df), bytes=tempos['bytes'], pico=pico_total,
+              arquivo=nome)
+    return df
@@ -0,0 +1,22 @@
+import multiprocessing
+import os
+
+
+def numero_de_processos(total_arquivos, max_workers=None):
+    """Quantidade de processos para um lote: parâmetro, variável XTE_PROCESSOS ou núcleos da máquina.
+
+    `total_arquivos` None = lote de tamanho ainda desconhecido (só o limite vale).
+    """
+    if max_workers is None:
+        max_workers = int(os.environ.get("XTE_PROCESSOS", "0")) or os.cpu_count() or 1
+    if total_arquivos is None:
+        return max(1, max_workers)
+    return max(1, min(max_workers, total_arquivos))
+
+
+def contexto_multiprocessing():
+    # O Streamlit registra o script como __main__; com "spawn"/"forkserver" cada
+    # processo filho executaria a interface de novo ao preparar o __main__.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
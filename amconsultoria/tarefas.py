@@ -0,0 +1,155 @@
+"""Conversões longas rodando em segundo plano, compartilhadas entre reruns e sessões.
+
+Uma tarefa é identificada por uma chave (o hash do conteúdo enviado mais as opções).
+Pedir de novo a mesma chave devolve a tarefa já existente, terminada ou em
+andamento, em vez de repetir o trabalho:
+
+    fila = FilaTarefas()
+    tarefa = fila.obter_ou_iniciar(chave, funcao, arquivo)
+    while not tarefa.concluida:
+        concluidos, total, nome = tarefa.progresso_atual()
+        ...
+    resultado = tarefa.resultado()
+
+`funcao(tarefa, *args)` recebe a própria Tarefa: grava o que precisar em
+`tarefa.diretorio` e pode usar `tarefa.progresso` como `ao_concluir`.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from amconsultoria.diagnostico import coletar
+
+# Tarefas terminadas mantidas (com os arquivos em disco) para novos pedidos da mesma chave
+LIMITE_TAREFAS_GUARDADAS = 8
+TAMANHO_BLOCO_HASH = 1 << 20
+
+
+def tarefas_simultaneas():
+    """Tarefas rodando ao mesmo tempo: variável XTE_TAREFAS ou 2 (cada uma já usa vários processos)."""
+    return int(os.environ.get("XTE_TAREFAS", "0")) or 2
+
+
+def hash_dos_envios(arquivos, *opcoes):
+    """SHA-256 do nome e do conteúdo de cada arquivo enviado, na ordem, mais as `opcoes` (repr).
+
+    Arquivos com `getbuffer()` (como os do st.file_uploader) são lidos sem cópia; os
+    demais, como streams binários em blocos.
+    """
+    sha256 = hashlib.sha256()
+    for arquivo in arquivos:
+        sha256.update(getattr(arquivo, "name", "").encode("utf-8") + b"\0")
+        if hasattr(arquivo, "getbuffer"):
+            with arquivo.getbuffer() as conteudo:
+                sha256.update(len(conteudo).to_bytes(8, "little"))
+                sha256.update(conteudo)
+        else:
+            arquivo.seek(0)
+            for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b""):
+                sha256.update(bloco)
+            arquivo.seek(0)
+    sha256.update(repr(opcoes).encode("utf-8"))
+    return sha256.hexdigest()
+
+
+class Tarefa:
+    """Um trabalho em segundo plano, com progresso consultável de qualquer thread."""
+
+    def __init__(self, chave):
+        self.chave = chave
+        self.diretorio = tempfile.mkdtemp(prefix="amconsultoria_")
+        self.inicio = time.time()
+        self.registros = []
+        self._progresso = (0, 0, None)
+        self._futuro = None
+
+    def progresso(self, concluidos, total, nome=None):
+        """Mesma assinatura do `ao_concluir` das conversões."""
+        self._progresso = (concluidos, total, nome)
+
+    def progresso_atual(self):
+        """(concluidos, total, nome do último item concluído)."""
+        return self._progresso
+
+    def restante(self):
+        """Estimativa em segundos pelo ritmo até agora (None antes do primeiro item)."""
+        concluidos, total, _ = self._progresso
+        if not concluidos:
+            return None
+        return (time.time() - self.inicio) / concluidos * (total - concluidos)
+
+    @property
+    def concluida(self):
+        return self._futuro.done()
+
+    @property
+    def falhou(self):
+        return self._futuro.done() and self._futuro.exception() is not None
+
+    def resultado(self, timeout=None):
+        """Espera a tarefa e devolve o resultado (o erro da tarefa é levantado aqui)."""
+        return self._futuro.result(timeout)
+
+    def descartar(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+
+class FilaTarefas:
+    """Executa as tarefas em um pool de threads e guarda as terminadas por chave (LRU)."""
+
+    def __init__(self, max_workers=None, limite=LIMITE_TAREFAS_GUARDADAS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or tarefas_simultaneas(),
+                                            thread_name_prefix="amconsultoria-tarefa")
+        self._limite = limite
+        self._tarefas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave):
+        with self._trava:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                self._tarefas.move_to_end(chave)
+            return tarefa
+
+    def obter_ou_iniciar(self, chave, funcao, *args, **kwargs):
+        """Devolve a tarefa da `chave`, iniciando `funcao(tarefa, *args, **kwargs)` se ainda não existe.
+
+        Uma tarefa que terminou com erro é descartada e iniciada de novo.
+        """
+        with self._trava:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None and not tarefa.falhou:
+                self._tarefas.move_to_end(chave)
+                return tarefa
+            if tarefa is not None:
+                tarefa.descartar()
+            tarefa = Tarefa(chave)
+            tarefa._futuro = self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+            self._tarefas[chave] = tarefa
+            self._liberar()
+            return tarefa
+
+    @staticmethod
+    def _executar(tarefa, funcao, args, kwargs):
+        # As medições ficam na própria tarefa (os coletores são por thread)
+        with coletar() as registros:
+            tarefa.registros = registros
+            return funcao(tarefa, *args, **kwargs)
+
+    def _liberar(self):
+        # Só tarefas terminadas saem; as em andamento nunca são descartadas
+        excedentes = len(self._tarefas) - self._limite
+        for chave in list(self._tarefas):
+            if excedentes <= 0:
+                break
+            tarefa = self._tarefas[chave]
+            if tarefa.concluida:
+                del self._tarefas[chave]
+                tarefa.descartar()
+                excedentes -= 1
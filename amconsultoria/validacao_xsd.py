@@ -0,0 +1,255 @@
+"""Validação de arquivos XTE contra o XSD do TISS de monitoramento (lxml).
+
+O XSD da ANS não vem com o projeto: extraia o pacote de schemas (o
+tissMonitoramentoV1_04_01.xsd e os arquivos que ele importa) em `amconsultoria/xsd/`
+ou aponte a variável XTE_XSD para o arquivo principal. O schema compilado fica em
+cache e é reaproveitado; processos criados por fork herdam os já compilados.
+
+Cada erro vira um `ErroXSD` com a linha, a coluna e a guia (posição no arquivo e
+numeroGuia_prestador) em que aconteceu, para apontar direto o que corrigir.
+"""
+
+import bisect
+import copy
+import io
+import os
+import re
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from amconsultoria.diagnostico import etapa
+from amconsultoria.layout_tiss import NS, XSD_TISS as NOME_XSD
+
+# Acima deste tamanho o arquivo é validado guia por guia, sem montar a árvore inteira
+LIMITE_VALIDACAO_INTEIRA = 64 << 20
+HASH_FICTICIO = "0" * 32
+
+ErroXSD = namedtuple("ErroXSD", "arquivo linha coluna indice_guia numero_guia mensagem")
+
+# O XMLSchema guarda o log de erros no próprio objeto, então cada validação em
+# andamento usa um exclusivo. Os compilados voltam para esta lista e são reaproveitados.
+_trava = threading.Lock()
+_livres = {}
+
+
+def _reiniciar_trava():
+    # Um fork feito enquanto outra thread segurava a trava deixaria o filho travado
+    global _trava
+    _trava = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_trava)
+
+
+def caminho_padrao_xsd():
+    return os.environ.get("XTE_XSD") or os.path.join(os.path.dirname(__file__), "xsd", NOME_XSD)
+
+
+def esquema_disponivel(caminho=None):
+    return os.path.isfile(caminho or caminho_padrao_xsd())
+
+
+def _chave_esquema(caminho):
+    caminho = os.path.realpath(caminho or caminho_padrao_xsd())
+    if not os.path.isfile(caminho):
+        raise FileNotFoundError(
+            f"XSD do TISS não encontrado em {caminho}. Coloque o {NOME_XSD} (e os XSD que ele importa) "
+            f"em amconsultoria/xsd/ ou informe o caminho em XTE_XSD."
+        )
+    return caminho, os.path.getmtime(caminho)
+
+
+@contextmanager
+def esquema_em_uso(caminho=None):
+    """Empresta um XMLSchema compilado para uso exclusivo; o XSD só é lido quando não há um livre."""
+    from lxml import etree
+
+    chave = _chave_esquema(caminho)
+    with _trava:
+        # XSD alterado no disco: os compilados antigos são descartados
+        for outra in [c for c in _livres if c != chave]:
+            del _livres[outra]
+        livres = _livres.setdefault(chave, [])
+        esquema = livres.pop() if livres else None
+    if esquema is None:
+        with etapa("validacao.compilar_xsd", arquivo=os.path.basename(chave[0])):
+            esquema = etree.XMLSchema(etree.parse(chave[0]))
+    try:
+        yield esquema
+    finally:
+        with _trava:
+            _livres.setdefault(chave, []).append(esquema)
+
+
+def carregar_esquema(caminho=None):
+    """Compila o XSD (se ainda não houver um compilado livre) e o deixa no cache.
+
+    Chamado antes de criar processos por fork, para que eles já nasçam com o schema.
+    """
+    with esquema_em_uso(caminho):
+        pass
+
+
+def _parser():
+    from lxml import etree
+
+    return etree.XMLParser(huge_tree=True, remove_blank_text=False, resolve_entities=False, no_network=True)
+
+
+def _guias(raiz):
+    """[(linha inicial, linha final, numeroGuia_prestador)] de cada guia, na ordem do arquivo."""
+    guias = []
+    for guia in raiz.iter(f"{{{NS}}}guiaMonitoramento"):
+        fim = max((e.sourceline or 0) for e in guia.iter())
+        guias.append((guia.sourceline or 0, fim, guia.findtext(f"{{{NS}}}numeroGuia_prestador")))
+    return guias
+
+
+def _erros(log, arquivo, guias, indice_base=0):
+    inicios = [inicio for inicio, _, _ in guias]
+    erros = []
+    for entrada in log:
+        indice = numero = None
+        posicao = bisect.bisect_right(inicios, entrada.line) - 1
+        if posicao >= 0 and entrada.line <= guias[posicao][1]:
+            indice = indice_base + posicao + 1
+            numero = guias[posicao][2]
+        erros.append(ErroXSD(arquivo, entrada.line, entrada.column, indice, numero, entrada.message))
+    return erros
+
+
+def _abrir(origem):
+    if isinstance(origem, (bytes, bytearray)):
+        return io.BytesIO(origem)
+    if isinstance(origem, (str, os.PathLike)):
+        return open(origem, "rb")
+    origem.seek(0)
+    return origem
+
+
+def validar_documento(origem, nome=None, esquema=None):
+    """Valida o documento inteiro (bytes, caminho ou stream). Devolve a lista de ErroXSD (vazia = válido)."""
+    from lxml import etree
+
+    if esquema is None:
+        with esquema_em_uso() as esquema:
+            return validar_documento(origem, nome, esquema)
+
+    nome = nome or (os.path.basename(origem) if isinstance(origem, str) else getattr(origem, "name", None))
+    stream = _abrir(origem)
+    try:
+        try:
+            arvore = etree.parse(stream, _parser())
+        except etree.XMLSyntaxError as erro:
+            return [ErroXSD(nome, erro.lineno, erro.offset, None, None, erro.msg)]
+    finally:
+        if stream is not origem:
+            stream.close()
+    if esquema.validate(arvore):
+        return []
+    return _erros(esquema.error_log, nome, _guias(arvore.getroot()))
+
+
+def _envelope(cabecalho, guia):
+    """Documento mínimo com o cabeçalho do arquivo e uma única guia, para validar a guia sozinha."""
+    from lxml import etree
+
+    raiz = etree.Element(f"{{{NS}}}mensagemEnvioANS", nsmap={"ans": NS})
+    if cabecalho is not None:
+        raiz.append(copy.deepcopy(cabecalho))
+    mensagem = etree.SubElement(raiz, f"{{{NS}}}Mensagem")
+    etree.SubElement(mensagem, f"{{{NS}}}operadoraParaANS").append(copy.deepcopy(guia))
+    etree.SubElement(etree.SubElement(raiz, f"{{{NS}}}epilogo"), f"{{{NS}}}hash").text = HASH_FICTICIO
+    return raiz
+
+
+def validar_por_guia(origem, nome=None, esquema=None):
+    """Valida um arquivo grande em streaming: cada guia é validada dentro de um envelope mínimo.
+
+    A memória usada depende do tamanho da maior guia. Erros do cabeçalho aparecem
+    uma vez só (junto com a primeira guia); o epílogo não é conferido nesse modo.
+    """
+    from lxml import etree
+
+    if esquema is None:
+        with esquema_em_uso() as esquema:
+            return validar_por_guia(origem, nome, esquema)
+    nome = nome or (os.path.basename(origem) if isinstance(origem, str) else getattr(origem, "name", None))
+    stream = _abrir(origem)
+    erros = []
+    cabecalho = None
+    indice = 0
+    linhas_cabecalho = set()
+    try:
+        eventos = etree.iterparse(stream, events=("end",), tag=(f"{{{NS}}}cabecalho", f"{{{NS}}}guiaMonitoramento"),
+                                  huge_tree=True, resolve_entities=False, no_network=True)
+        for _, elem in eventos:
+            if elem.tag == f"{{{NS}}}cabecalho":
+                cabecalho = copy.deepcopy(elem)
+                linhas_cabecalho = {e.sourceline for e in cabecalho.iter()}
+                continue
+            if not esquema.validate(_envelope(cabecalho, elem)):
+                fim = max((e.sourceline or 0) for e in elem.iter())
+                guia = [(elem.sourceline or 0, fim, elem.findtext(f"{{{NS}}}numeroGuia_prestador"))]
+                for erro in _erros(esquema.error_log, nome, guia, indice):
+                    # Erros do cabeçalho se repetiriam em todos os envelopes
+                    if erro.indice_guia is None and erro.linha in linhas_cabecalho and indice > 0:
+                        continue
+                    erros.append(erro)
+            indice += 1
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    except etree.XMLSyntaxError as erro:
+        erros.append(ErroXSD(nome, erro.lineno, erro.offset, None, None, erro.msg))
+    finally:
+        if stream is not origem:
+            stream.close()
+    return erros
+
+
+def validar_xte(origem, nome=None, caminho_xsd=None, por_guia=None):
+    """Valida um XTE (bytes, caminho ou stream) e devolve a lista de ErroXSD (vazia = válido).
+
+    Arquivos grandes (ou `por_guia=True`) são validados guia por guia; os demais inteiros.
+    """
+    if por_guia is None:
+        if isinstance(origem, (bytes, bytearray)):
+            tamanho = len(origem)
+        elif isinstance(origem, (str, os.PathLike)):
+            tamanho = os.path.getsize(origem)
+        else:
+            origem.seek(0, os.SEEK_END)
+            tamanho = origem.tell()
+        por_guia = tamanho > LIMITE_VALIDACAO_INTEIRA
+    with etapa("validacao.xsd", arquivo=nome, por_guia=por_guia) as medicao, esquema_em_uso(caminho_xsd) as esquema:
+        if por_guia:
+            erros = validar_por_guia(origem, nome, esquema)
+        else:
+            erros = validar_documento(origem, nome, esquema)
+        medicao.contexto["erros"] = len(erros)
+    return erros
+
+
+def validar_lote(documentos, max_workers=None, caminho_xsd=None, por_guia=None):
+    """Valida vários documentos em paralelo. `documentos` é {nome: bytes ou caminho}.
+
+    O lxml libera o GIL durante o parse e a validação, então threads bastam.
+    Devolve {nome: [ErroXSD]} na ordem de `documentos`.
+    """
+    carregar_esquema(caminho_xsd)  # falha logo se o XSD não existir
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {nome: executor.submit(validar_xte, origem, nome, caminho_xsd, por_guia)
+                   for nome, origem in documentos.items()}
+        return {nome: futuro.result() for nome, futuro in futuros.items()}
+
+
+def resumo_erro(erro):
+    """Texto curto de um ErroXSD, usado nos logs e na linha de comando."""
+    guia = f" guia {erro.indice_guia} ({erro.numero_guia})" if erro.indice_guia else ""
+    mensagem = re.sub(r"\{[^}]*\}", "", erro.mensagem or "")
+    return f"{erro.arquivo}:{erro.linha}:{erro.coluna}{guia}: {mensagem}"
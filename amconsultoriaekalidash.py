@@ -1,142 +1,179 @@
 import streamlit as st
 import pandas as pd
-import xml.etree.ElementTree as ET
-import hashlib
-import io
-from datetime import datetime
-import re
 from collections import defaultdict
-import xml.dom.minidom as minidom
 import os
-import zipfile
 import time
-from datetime import datetime
-import pytz # Importar pytz
 
-
-
-@st.cache_data
-def parse_xte(file):
-    file.seek(0)
-    content = file.read().decode('iso-8859-1')
-    tree = ET.ElementTree(ET.fromstring(content))
-    root = tree.getroot()
-    ns = {'ans': 'http://www.ans.gov.br/padroes/tiss/schemas'}
-    all_data = []
-    
-    # Coleta as informações do cabecalho uma vez
-    cabecalho_info = {}
-    cabecalho = root.find('.//ans:cabecalho', namespaces=ns)
-    if cabecalho is not None:
-        identificacao = cabecalho.find('ans:identificacaoTransacao', namespaces=ns)
-        if identificacao is not None:
-            cabecalho_info['tipoTransacao'] = identificacao.findtext('ans:tipoTransacao', default='', namespaces=ns)
-            cabecalho_info['numeroLote'] = identificacao.findtext('ans:numeroLote', default='', namespaces=ns)
-            cabecalho_info['competenciaLote'] = identificacao.findtext('ans:competenciaLote', default='', namespaces=ns)
-            cabecalho_info['dataRegistroTransacao'] = identificacao.findtext('ans:dataRegistroTransacao', default='', namespaces=ns)
-            cabecalho_info['horaRegistroTransacao'] = identificacao.findtext('ans:horaRegistroTransacao', default='', namespaces=ns)
-        cabecalho_info['registroANS'] = cabecalho.findtext('ans:registroANS', default='', namespaces=ns)
-        cabecalho_info['versaoPadrao'] = cabecalho.findtext('ans:versaoPadrao', default='', namespaces=ns)
-
-    for guia in root.findall(".//ans:guiaMonitoramento", namespaces=ns):
-        guia_data = {}
-        guia_data.update(cabecalho_info)
-
-        # Loop principal para ler todas as tags como texto
-        for elem in guia.iter():
-            tag_full = elem.tag.split('}')[-1]
-            if 'data' in tag_full.lower() and elem.text:
-                try:
-                    date_obj = datetime.strptime(elem.text, '%Y-%m-%d')
-                    guia_data[tag_full] = date_obj.strftime('%d/%m/%Y')
-                except ValueError:
-                    guia_data[tag_full] = elem.text
-            else:
-                guia_data[tag_full] = elem.text if elem.text else None
-
-        procedimentos = guia.findall(".//ans:procedimentos", namespaces=ns)
-        if procedimentos:
-            for proc in procedimentos:
-                proc_data = guia_data.copy()
-                # Extração específica dos procedimentos
-                proc_data['codigoProcedimento'] = (proc.findtext('ans:identProcedimento/ans:Procedimento/ans:codigoProcedimento', namespaces=ns) or '').strip()
-                proc_data['grupoProcedimento'] = (proc.findtext('ans:identProcedimento/ans:Procedimento/ans:grupoProcedimento', namespaces=ns) or '').strip()
-                proc_data['valorInformado'] = (proc.findtext('ans:valorInformado', namespaces=ns) or '').strip()
-                proc_data['valorPagoProc'] = (proc.findtext('ans:valorPagoProc', namespaces=ns) or '').strip()
-                campos_procedimento = ['quantidadeInformada', 'quantidadePaga', 'valorPagoFornecedor', 'valorCoParticipacao', 'unidadeMedida']
-                for campo in campos_procedimento:
-                    proc_data[campo] = (proc.findtext(f'ans:{campo}', namespaces=ns) or '').strip()
-                proc_data['codigoTabela'] = (proc.findtext('ans:identProcedimento/ans:codigoTabela', namespaces=ns) or '').strip()
-                proc_data['registroANSOperadoraIntermediaria'] = (proc.findtext('ans:registroANSOperadoraIntermediaria', namespaces=ns) or '').strip()
-                proc_data['tipoAtendimentoOperadoraIntermediaria'] = (proc.findtext('ans:tipoAtendimentoOperadoraIntermediaria', namespaces=ns) or '').strip()
-                all_data.append(proc_data)
+from amconsultoria.cache_parquet import CacheParquet
+from amconsultoria.consulta import ConsultaConsolidada
+from amconsultoria.diagnostico import configurar_log, etapa
+from amconsultoria.esquema import COLUNAS_FINAIS, concatenar
+from amconsultoria.exportacao import LIMITE_LINHAS_EXCEL, MIMES, NOMES_ARQUIVOS, exportar_consolidado
+from amconsultoria.gerador_xte import gerar_xte_em_zips
+from amconsultoria.ingestao import ler_xtes_em_paralelo
+from amconsultoria.tarefas import FilaTarefas, hash_dos_envios
+from amconsultoria.validacao_xsd import esquema_disponivel
+
+INTERVALO_PROGRESSO = 0.5  # segundos entre atualizações da barra enquanto uma tarefa roda
+TODAS_AS_LINHAS = "(todas as linhas)"
+
+
+def mostrar_diagnostico(registros):
+    """Painel com o tempo, volume e memória de cada etapa da última execução."""
+    with st.expander("🩺 Diagnóstico de desempenho", expanded=False):
+        if not registros:
+            st.write("Nenhuma medição registrada.")
+            return
+        medicoes = pd.DataFrame(registros)
+        resumo = medicoes.groupby("etapa", sort=False).agg(
+            execucoes=("etapa", "size"),
+            segundos=("segundos", "sum"),
+            linhas=("linhas", "sum"),
+            bytes=("bytes", "sum"),
+            pico_rss_mb=("pico_rss_mb", "max"),
+        ).sort_values("segundos", ascending=False)
+        st.markdown("**Resumo por etapa**")
+        st.dataframe(resumo)
+        st.markdown("**Medições**")
+        st.dataframe(medicoes)
+
+
+def mostrar_erros_xsd(erros_por_arquivo):
+    """Resumo da validação contra o XSD do TISS: sucesso ou a tabela de erros com guia e linha."""
+    erros = [erro for lista in erros_por_arquivo.values() for erro in lista]
+    if not erros:
+        st.success(f"✅ {len(erros_por_arquivo)} arquivo(s) válidos segundo o XSD do TISS.")
+        return
+    arquivos = sum(1 for lista in erros_por_arquivo.values() if lista)
+    st.error(f"❌ {len(erros)} erro(s) de schema em {arquivos} arquivo(s).")
+    tabela = pd.DataFrame(erros).rename(columns={
+        "arquivo": "Arquivo", "linha": "Linha", "coluna": "Coluna",
+        "indice_guia": "Guia nº", "numero_guia": "numeroGuia_prestador", "mensagem": "Erro",
+    })
+    tabela["Erro"] = tabela["Erro"].str.replace(r"\{[^}]*\}", "", regex=True)
+    st.dataframe(tabela, hide_index=True)
+
+
+def mostrar_problemas_planilha(problemas, total):
+    """Avisos da leitura da planilha (datas, valores e linhas sem Nome da Origem)."""
+    if not total:
+        return
+    st.warning(f"⚠️ {total} problema(s) encontrados na planilha; os arquivos foram gerados com os valores como estão.")
+    tabela = pd.DataFrame(problemas).rename(columns={
+        "linha": "Linha", "coluna": "Coluna", "valor": "Valor", "mensagem": "Problema",
+    })
+    if total > len(problemas):
+        st.caption(f"Exibindo os primeiros {len(problemas)}.")
+    st.dataframe(tabela, hide_index=True)
+
+
+@st.cache_resource
+def fila_de_tarefas():
+    """Fila única do servidor: conversões iguais pedidas por sessões diferentes rodam uma vez só."""
+    return FilaTarefas()
+
+
+def hash_do_envio(prefixo, arquivos, *opcoes):
+    """Hash do conteúdo enviado, calculado uma vez por envio em cada sessão."""
+    ids = (prefixo,) + tuple(getattr(f, "file_id", (f.name, f.size)) for f in arquivos) + opcoes
+    hashes = st.session_state.setdefault("hashes_envio", {})
+    if ids not in hashes:
+        hashes[ids] = f"{prefixo}-{hash_dos_envios(arquivos, *opcoes)}"
+    return hashes[ids]
+
+
+def acompanhar_tarefa(tarefa, verbo):
+    """Mostra o progresso até a tarefa terminar e devolve o resultado.
+
+    Um rerun interrompe só a exibição: a tarefa continua na fila e o próximo
+    rerun volta a acompanhá-la.
+    """
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    while not tarefa.concluida:
+        concluidos, total, nome = tarefa.progresso_atual()
+        if total:
+            progress_bar.progress(concluidos / total)
+            restante = tarefa.restante()
+            status_text.markdown(
+                f"{verbo} {concluidos} de {total} arquivos ({concluidos / total:.0%})  \
+                Estimado restante: {int(restante or 0)} segundos 🕒" + (f"  \n`{nome}`" if nome else "")
+            )
         else:
-            all_data.append(guia_data)
+            status_text.markdown("⏳ Lendo os arquivos enviados...")
+        time.sleep(INTERVALO_PROGRESSO)
+    progress_bar.progress(1.0)
+    status_text.empty()
+    return tarefa.resultado()
+
+
+def consolidar_xtes(tarefa, arquivos, validar):
+    """Tarefa da página XTE → Excel: lê, consolida e exporta em `tarefa.diretorio`."""
+    falhas = []
+    erros_xsd = {}
+    all_dfs = ler_xtes_em_paralelo(arquivos, ao_concluir=tarefa.progresso, cache=CacheParquet(),
+                                   ao_falhar=lambda nome, erro: falhas.append((nome, f"{type(erro).__name__}: {erro}")),
+                                   ao_validar=erros_xsd.__setitem__ if validar else None)
+    final_df = concatenar(all_dfs)
+    del all_dfs
+    exportacoes = exportar_consolidado(final_df, tarefa.diretorio, colunas=COLUNAS_FINAIS)
+    linhas = len(final_df)
+    del final_df
+    # As consultas da página leem o Arrow exportado (memory map); índices e resumos saem prontos da tarefa
+    with etapa("consulta.indices") as medicao:
+        medicao.linhas = linhas
+        consulta = ConsultaConsolidada.abrir(exportacoes["arrow"]).preparar()
+    return {"linhas": linhas, "consulta": consulta, "exportacoes": exportacoes,
+            "falhas": falhas, "erros_xsd": erros_xsd}
+
+
+def mostrar_consulta(consulta):
+    """Busca pelos campos indexados, páginas do resultado e resumos já calculados."""
+    st.subheader("🔍 Consulta dos dados:")
+    col_campo, col_valor = st.columns([1, 2])
+    campo = col_campo.selectbox("Buscar por", [TODAS_AS_LINHAS] + consulta.colunas_indexadas)
+    valor = col_valor.text_input("Valor (separe vários por vírgula)", disabled=campo == TODAS_AS_LINHAS)
+
+    linhas = None
+    if campo != TODAS_AS_LINHAS and valor.strip():
+        linhas = consulta.buscar({campo: [v for v in valor.split(",") if v.strip()]})
+    total = consulta.linhas if linhas is None else len(linhas)
+
+    col_pagina, col_total = st.columns([1, 2])
+    paginas = consulta.paginas(total)
+    # A chave muda com a busca, então uma nova busca volta para a página 1
+    pagina = col_pagina.number_input("Página", min_value=1, max_value=paginas, value=1, step=1,
+                                     key=f"pagina_consulta_{campo}_{valor}")
+    col_total.caption(f"{total} linha(s) · página {pagina} de {paginas}")
+    dados = consulta.pagina(pagina - 1, linhas=linhas)
+    st.dataframe(dados, column_config={
+        col: st.column_config.DateColumn(format="DD/MM/YYYY")
+        for col in dados.select_dtypes(include="datetime").columns
+    })
+
+    colunas_resumo = consulta.colunas_resumo
+    if colunas_resumo:
+        with st.expander("📊 Resumos", expanded=False):
+            for aba, coluna in zip(st.tabs(colunas_resumo), colunas_resumo):
+                aba.dataframe(consulta.resumo(coluna), hide_index=True)
+
+
+def gerar_xtes(tarefa, excel_file):
+    """Tarefa da página Excel → XTE: gera os ZIPs de XML e XTE em `tarefa.diretorio`."""
+    zips = {
+        ".xml": os.path.join(tarefa.diretorio, "arquivos_xml.zip"),
+        ".xte": os.path.join(tarefa.diretorio, "arquivos_xte.zip"),
+    }
+    # Com o XSD disponível, todo arquivo gerado é validado junto com a compactação
+    erros_xsd = {} if esquema_disponivel() else None
+    leitura = {"problemas": [], "total": 0}
+    nomes, primeiro_arquivo = gerar_xte_em_zips(
+        excel_file, zips, ao_concluir=tarefa.progresso,
+        ao_validar=erros_xsd.__setitem__ if erros_xsd is not None else None,
+        ao_problemas=lambda problemas, total: leitura.update(problemas=problemas, total=total),
+    )
+    return {"zips": zips, "nomes": nomes, "exemplo": primeiro_arquivo, "erros_xsd": erros_xsd, "leitura": leitura}
 
-    df = pd.DataFrame(all_data)
-    df['Nome da Origem'] = file.name
-
-    date_columns = [col for col in df.columns if 'data' in col.lower()]
-    for col in date_columns:
-        try:
-            df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce').dt.strftime('%d/%m/%Y')
-        except Exception:
-            pass
-
-    # Calcular idade
-    if 'dataRealizacao' in df.columns and 'dataNascimento' in df.columns:
-        def calcular_idade(row):
-            try:
-                data_realizacao = datetime.strptime(row['dataRealizacao'], '%d/%m/%Y')
-                data_nascimento = datetime.strptime(row['dataNascimento'], '%d/%m/%Y')
-                return (data_realizacao - data_nascimento).days // 365
-            except Exception:
-                return None
-        df['Idade_na_Realização'] = df.apply(calcular_idade, axis=1)
-
-    # --- BLOCO DE REMOÇÃO DE ZEROS À ESQUERDA FOI REMOVIDO DAQUI ---
-
-    # --- Padronização e ordenação das colunas (sem alterações) ---
-    df.rename(columns={
-        'valorInformado': 'valorInformado_proc',
-        'valorPagoFornecedor': 'valorPagoFornecedor_proc',
-        'dataRegistroTransacao': 'dataRegistroTransacao_cabecalho',
-        'horaRegistroTransacao': 'horaRegistroTransacao_cabecalho',
-        'registroANS': 'registroANS_cabecalho',
-        'versaoPadrao': 'versaoPadrao_cabecalho'
-    }, inplace=True)
-
-    colunas_finais = [
-        'Nome da Origem', 'tipoRegistro', 'versaoTISSPrestador', 'formaEnvio', 'tipoTransacao',
-        'numeroLote', 'competenciaLote', 'dataRegistroTransacao_cabecalho', 'horaRegistroTransacao_cabecalho',
-        'registroANS_cabecalho', 'versaoPadrao_cabecalho', 'CNES', 'identificadorExecutante',
-        'codigoCNPJ_CPF', 'municipioExecutante', 'registroANSOperadoraIntermediaria',
-        'tipoAtendimentoOperadoraIntermediaria', 'numeroCartaoNacionalSaude', 'cpfBeneficiario',
-        'sexo', 'dataNascimento', 'municipioResidencia', 'numeroRegistroPlano',
-        'tipoEventoAtencao', 'origemEventoAtencao', 'numeroGuia_prestador', 'numeroGuia_operadora',
-        'identificacaoReembolso', 'formaRemuneracao', 'valorRemuneracao', 'guiaSolicitacaoInternacao',
-        'dataSolicitacao', 'numeroGuiaSPSADTPrincipal', 'dataAutorizacao', 'dataRealizacao',
-        'dataFimPeriodo','dataInicialFaturamento', 'dataProtocoloCobranca', 'dataPagamento', 'dataProcessamentoGuia',
-        'tipoConsulta', 'cboExecutante', 'indicacaoRecemNato', 'indicacaoAcidente',
-        'caraterAtendimento', 'tipoInternacao', 'regimeInternacao', 'tipoAtendimento',
-        'regimeAtendimento', 'tipoFaturamento', 'diariasAcompanhante', 'diariasUTI', 'motivoSaida',
-        'valorTotalInformado', 'valorProcessado', 'valorTotalPagoProcedimentos', 'valorTotalDiarias',
-        'valorTotalTaxas', 'valorTotalMateriais', 'valorTotalOPME', 'valorTotalMedicamentos',
-        'valorGlosaGuia', 'valorPagoGuia', 'valorPagoFornecedores', 'valorTotalTabelaPropria',
-        'valorTotalCoParticipacao', 'declaracaoNascido', 'declaracaoObito', 'codigoTabela',
-        'grupoProcedimento', 'codigoProcedimento', 'quantidadeInformada','valorInformado', 'valorInformado_proc',
-        'valorPagoFornecedor','quantidadePaga', 'unidadeMedida','valorCoParticipacao', 'valorPagoProc', 'valorPagoFornecedor_proc',
-        'Idade_na_Realização', 'diagnosticoCID'
-    ]
-
-    for col in colunas_finais:
-        if col not in df.columns:
-            df[col] = None
-    
-    df = df[colunas_finais]
-
-    return df, content, tree
-    
 
 def remove_duplicate_columns(df):
     df = df.loc[:, ~df.columns.duplicated()]
@@ -144,228 +181,15 @@ def remove_duplicate_columns(df):
     return df
 
 
-def gerar_xte_do_excel(excel_file):
-    print("--- DEBUG: Gerando XTE com lote por Minuto e Segundo (versão completa) ---")
-    ns = "http://www.ans.gov.br/padroes/tiss/schemas"
-
-    # --- Setup de Data/Hora e Leitura do Arquivo ---
-    fuso_horario_servidor = pytz.utc
-    fuso_horario_desejado = pytz.timezone("America/Sao_Paulo")
-    agora_no_fuso_desejado = datetime.now(fuso_horario_servidor).astimezone(fuso_horario_desejado)
-    data_atual = agora_no_fuso_desejado.strftime("%Y-%m-%d")
-    hora_atual = agora_no_fuso_desejado.strftime("%H:%M:%S")
-
-    # AJUSTE FINAL: Trocando Hora (%H) por Minuto (%M) na composição do lote.
-    minuto_e_segundos_atuais = agora_no_fuso_desejado.strftime("%M%S")
-
-    if hasattr(excel_file, 'name') and excel_file.name.endswith('.csv'):
-        df = pd.read_csv(excel_file, dtype=str, sep=';')
-    else:
-        df = pd.read_excel(excel_file, dtype=str)
-
-    # --- Função Auxiliar 'sub' ---
-    def sub(parent, tag, value, is_date=False):
-        if pd.isna(value):
-            return
-        text = str(value).strip()
-        if is_date and text:
-            original_text = text
-            text = original_text
-            for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
-                try:
-                    text = datetime.strptime(original_text, fmt).strftime("%Y-%m-%d")
-                    break
-                except ValueError:
-                    continue
-        if text:
-            ET.SubElement(parent, f"ans:{tag}").text = text
-
-    def extrair_texto(elemento):
-        textos = []
-        if elemento.text: textos.append(elemento.text.strip())
-        for filho in elemento:
-            textos.extend(extrair_texto(filho))
-            if filho.tail: textos.append(filho.tail.strip())
-        return textos
-
-    arquivos_gerados = {}
-    if "Nome da Origem" not in df.columns:
-        raise ValueError("A coluna 'Nome da Origem' é obrigatória no Excel.")
-
-    # --- Início da Geração do XML ---
-    for nome_arquivo, df_origem in df.groupby("Nome da Origem"):
-        if df_origem.empty: continue
-
-        agrupado = df_origem.groupby(
-            ["numeroGuia_prestador", "numeroGuia_operadora", "identificacaoReembolso"], dropna=False
-        )
-        
-        root = ET.Element("ans:mensagemEnvioANS", attrib={
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance", "xmlns:xsd": "http://www.w3.org/2001/XMLSchema",
-            "xsi:schemaLocation": f"{ns} {ns}/tissMonitoramentoV1_04_01.xsd", "xmlns:ans": ns
-        })
-        
-        linha_cabecalho = df_origem.iloc[0]
-        
-        # --- Bloco do Cabeçalho ---
-        cabecalho = ET.SubElement(root, "ans:cabecalho")
-        identificacaoTransacao = ET.SubElement(cabecalho, "ans:identificacaoTransacao")
-        sub(identificacaoTransacao, "tipoTransacao", "MONITORAMENTO")
-        
-        # AJUSTE FINAL: Geração do numeroLote com Minuto e Segundo
-        competencia = linha_cabecalho.get("competenciaLote", "")
-        if competencia and len(competencia) == 6 and competencia.isdigit():
-            numero_lote_final = f"{competencia}{minuto_e_segundos_atuais}"
-        else:
-            ano_e_mes_atuais = agora_no_fuso_desejado.strftime("%Y%m")
-            numero_lote_final = f"{ano_e_mes_atuais}{minuto_e_segundos_atuais}"
-
-        sub(identificacaoTransacao, "numeroLote", numero_lote_final)
-        sub(identificacaoTransacao, "competenciaLote", linha_cabecalho.get("competenciaLote"))
-        sub(identificacaoTransacao, "dataRegistroTransacao", data_atual)
-        sub(identificacaoTransacao, "horaRegistroTransacao", hora_atual)
-        sub(cabecalho, "registroANS", linha_cabecalho.get("registroANS_cabecalho"))
-        sub(cabecalho, "versaoPadrao", linha_cabecalho.get("versaoPadrao_cabecalho", "1.04.01"))
-
-        mensagem = ET.SubElement(root, "ans:Mensagem")
-        op_ans = ET.SubElement(mensagem, "ans:operadoraParaANS")
-
-        # --- Loop Principal para cada Guia ---
-        for _, grupo_guia_key in agrupado:
-            linha_guia = grupo_guia_key.iloc[0]
-            guia = ET.SubElement(op_ans, "ans:guiaMonitoramento")
-
-            # --- Mapeamento Estruturado da Guia (Nível da Guia) ---
-            sub(guia, "tipoRegistro", linha_guia.get("tipoRegistro"))
-            sub(guia, "versaoTISSPrestador", linha_guia.get("versaoTISSPrestador"))
-            sub(guia, "formaEnvio", linha_guia.get("formaEnvio"))
-            
-            dadosContratadoExecutante_el = ET.SubElement(guia, "ans:dadosContratadoExecutante")
-            sub(dadosContratadoExecutante_el, "CNES", linha_guia.get("CNES"))
-            sub(dadosContratadoExecutante_el, "identificadorExecutante", linha_guia.get("identificadorExecutante"))
-            sub(dadosContratadoExecutante_el, "codigoCNPJ_CPF", linha_guia.get("codigoCNPJ_CPF"))
-            sub(dadosContratadoExecutante_el, "municipioExecutante", linha_guia.get("municipioExecutante"))
-
-            sub(guia, "registroANSOperadoraIntermediaria", linha_guia.get("registroANSOperadoraIntermediaria"))
-            sub(guia, "tipoAtendimentoOperadoraIntermediaria", linha_guia.get("tipoAtendimentoOperadoraIntermediaria"))
-
-            dadosBeneficiario_el = ET.SubElement(guia, "ans:dadosBeneficiario")
-            identBeneficiario_el = ET.SubElement(dadosBeneficiario_el, "ans:identBeneficiario")
-            sub(identBeneficiario_el, "numeroCartaoNacionalSaude", linha_guia.get("numeroCartaoNacionalSaude"))
-            sub(identBeneficiario_el, "cpfBeneficiario", linha_guia.get("cpfBeneficiario"))
-            sub(identBeneficiario_el, "sexo", linha_guia.get("sexo"))
-            sub(identBeneficiario_el, "dataNascimento", linha_guia.get("dataNascimento"), is_date=True)
-            sub(identBeneficiario_el, "municipioResidencia", linha_guia.get("municipioResidencia"))
-            sub(dadosBeneficiario_el, "numeroRegistroPlano", linha_guia.get("numeroRegistroPlano"))
-
-            sub(guia, "tipoEventoAtencao", linha_guia.get("tipoEventoAtencao"))
-            sub(guia, "origemEventoAtencao", linha_guia.get("origemEventoAtencao"))
-            sub(guia, "numeroGuia_prestador", linha_guia.get("numeroGuia_prestador"))
-            sub(guia, "numeroGuia_operadora", linha_guia.get("numeroGuia_operadora"))
-            
-            origem_evento = linha_guia.get("origemEventoAtencao")
-            valor_reembolso = ""
-            if origem_evento in ['1', '2', '3']:
-                valor_reembolso = "00000000000000000000"
-            else:
-                valor_reembolso = linha_guia.get("identificacaoReembolso")
-            sub(guia, "identificacaoReembolso", valor_reembolso)
-            
-            if pd.notna(linha_guia.get("formaRemuneracao")) or pd.notna(linha_guia.get("valorRemuneracao")):
-                formasRemuneracao_el = ET.SubElement(guia, "ans:formasRemuneracao")
-                sub(formasRemuneracao_el, "formaRemuneracao", linha_guia.get("formaRemuneracao"))
-                sub(formasRemuneracao_el, "valorRemuneracao", linha_guia.get("valorRemuneracao"))
-            
-            sub(guia, "guiaSolicitacaoInternacao", linha_guia.get("guiaSolicitacaoInternacao"))
-            sub(guia, "dataSolicitacao", linha_guia.get("dataSolicitacao"), is_date=True)
-            sub(guia, "numeroGuiaSPSADTPrincipal", linha_guia.get("numeroGuiaSPSADTPrincipal"))
-            sub(guia, "dataAutorizacao", linha_guia.get("dataAutorizacao"), is_date=True)
-            sub(guia, "dataRealizacao", linha_guia.get("dataRealizacao"), is_date=True)
-            sub(guia, "dataInicialFaturamento", linha_guia.get("dataInicialFaturamento"), is_date=True)
-            sub(guia, "dataFimPeriodo", linha_guia.get("dataFimPeriodo"), is_date=True)
-            sub(guia, "dataProtocoloCobranca", linha_guia.get("dataProtocoloCobranca"), is_date=True)
-            sub(guia, "dataPagamento", linha_guia.get("dataPagamento"), is_date=True)
-            sub(guia, "dataProcessamentoGuia", linha_guia.get("dataProcessamentoGuia"), is_date=True)
-            sub(guia, "tipoConsulta", linha_guia.get("tipoConsulta"))
-            sub(guia, "cboExecutante", linha_guia.get("cboExecutante"))
-            sub(guia, "indicacaoRecemNato", linha_guia.get("indicacaoRecemNato"))
-            sub(guia, "indicacaoAcidente", linha_guia.get("indicacaoAcidente"))
-            sub(guia, "caraterAtendimento", linha_guia.get("caraterAtendimento"))
-            sub(guia, "tipoInternacao", linha_guia.get("tipoInternacao"))
-            sub(guia, "regimeInternacao", linha_guia.get("regimeInternacao"))
-            
-            if pd.notna(linha_guia.get("diagnosticoCID")):
-                diagnosticosCID10_el = ET.SubElement(guia, "ans:diagnosticosCID10")
-                sub(diagnosticosCID10_el, "diagnosticoCID", linha_guia.get("diagnosticoCID"))
-            
-            sub(guia, "tipoAtendimento", linha_guia.get("tipoAtendimento"))
-            sub(guia, "regimeAtendimento", linha_guia.get("regimeAtendimento"))
-            sub(guia, "tipoFaturamento", linha_guia.get("tipoFaturamento"))
-            sub(guia, "diariasAcompanhante", linha_guia.get("diariasAcompanhante"))
-            sub(guia, "diariasUTI", linha_guia.get("diariasUTI"))
-            sub(guia, "motivoSaida", linha_guia.get("motivoSaida"))
-
-            valoresGuia_el = ET.SubElement(guia, "ans:valoresGuia")
-            sub(valoresGuia_el, "valorTotalInformado", linha_guia.get("valorTotalInformado"))
-            sub(valoresGuia_el, "valorProcessado", linha_guia.get("valorProcessado"))
-            sub(valoresGuia_el, "valorTotalPagoProcedimentos", linha_guia.get("valorTotalPagoProcedimentos"))
-            sub(valoresGuia_el, "valorTotalDiarias", linha_guia.get("valorTotalDiarias"))
-            sub(valoresGuia_el, "valorTotalTaxas", linha_guia.get("valorTotalTaxas"))
-            sub(valoresGuia_el, "valorTotalMateriais", linha_guia.get("valorTotalMateriais"))
-            sub(valoresGuia_el, "valorTotalOPME", linha_guia.get("valorTotalOPME"))
-            sub(valoresGuia_el, "valorTotalMedicamentos", linha_guia.get("valorTotalMedicamentos"))
-            sub(valoresGuia_el, "valorGlosaGuia", linha_guia.get("valorGlosaGuia"))
-            sub(valoresGuia_el, "valorPagoGuia", linha_guia.get("valorPagoGuia"))
-            sub(valoresGuia_el, "valorPagoFornecedores", linha_guia.get("valorPagoFornecedores"))
-            sub(valoresGuia_el, "valorTotalTabelaPropria", linha_guia.get("valorTotalTabelaPropria"))
-            sub(valoresGuia_el, "valorTotalCoParticipacao", linha_guia.get("valorTotalCoParticipacao"))
-
-            sub(guia, "declaracaoNascido", linha_guia.get("declaracaoNascido"))
-            sub(guia, "declaracaoObito", linha_guia.get("declaracaoObito"))
-
-            # --- Loop Interno para cada Procedimento da Guia ---
-            for _, proc_linha in grupo_guia_key.iterrows():
-                if pd.notna(proc_linha.get("codigoProcedimento")) or pd.notna(proc_linha.get("grupoProcedimento")):
-                    procedimentos_el = ET.SubElement(guia, "ans:procedimentos")
-                    identProcedimento_el = ET.SubElement(procedimentos_el, "ans:identProcedimento")
-                    sub(identProcedimento_el, "codigoTabela", proc_linha.get("codigoTabela"))
-                    Procedimento_el = ET.SubElement(identProcedimento_el, "ans:Procedimento")
-                    
-                    if pd.notna(proc_linha.get("grupoProcedimento")):
-                        sub(Procedimento_el, "grupoProcedimento", proc_linha.get("grupoProcedimento"))
-                    elif pd.notna(proc_linha.get("codigoProcedimento")):
-                        sub(Procedimento_el, "codigoProcedimento", proc_linha.get("codigoProcedimento"))
-                    
-                    sub(procedimentos_el, "quantidadeInformada", proc_linha.get("quantidadeInformada"))
-                    sub(procedimentos_el, "valorInformado", proc_linha.get("valorInformado_proc"))
-                    sub(procedimentos_el, "quantidadePaga", proc_linha.get("quantidadePaga"))
-                    sub(procedimentos_el, "unidadeMedida", proc_linha.get("unidadeMedida"))
-                    sub(procedimentos_el, "valorPagoProc", proc_linha.get("valorPagoProc"))
-                    sub(procedimentos_el, "valorPagoFornecedor", proc_linha.get("valorPagoFornecedor_proc"))
-                    sub(procedimentos_el, "valorCoParticipacao", proc_linha.get("valorCoParticipacao"))
-
-        # --- Finalização com Hash e Formatação ---
-        conteudo_cabecalho = ''.join(extrair_texto(cabecalho))
-        conteudo_mensagem = ''.join(extrair_texto(mensagem))
-        conteudo_para_hash = conteudo_cabecalho + conteudo_mensagem
-        hash_value = hashlib.md5(conteudo_para_hash.encode('iso-8859-1')).hexdigest()
-        epilogo = ET.SubElement(root, "ans:epilogo")
-        ET.SubElement(epilogo, "ans:hash").text = hash_value
-        xml_string = ET.tostring(root, encoding="utf-8", method="xml")
-        dom = minidom.parseString(xml_string)
-        final_pretty = dom.toprettyxml(indent="  ", encoding="iso-8859-1")
-        nome_base, _ = os.path.splitext(nome_arquivo)
-        nome_limpo = re.sub(r'[^a-zA-Z0-9_\-]', '_', nome_base)
-        arquivos_gerados[f"{nome_limpo}.xml"] = final_pretty
-        arquivos_gerados[f"{nome_limpo}.xte"] = final_pretty
-
-    return arquivos_gerados
 ######################################### STREAM LIT #########################################  
 
 
 # Forçar tema escuro
 st.set_page_config(page_title="Conversor Avançado de XTE", layout="wide")
 
+# Medições de cada etapa saem como linhas JSON no log do servidor
+configurar_log()
+
 # Custom CSS para destaque do menu
 st.markdown("""
     <style>
@@ -386,6 +210,7 @@ menu = st.sidebar.radio("Escolha uma operação:", [
     "Converter XTE para Excel e CSV",
     "Converter Excel para XTE/XML"
 ])
+exibir_diagnostico = st.sidebar.checkbox("Mostrar diagnóstico de desempenho", value=False)
 
 st.title("Conversor Avançado de XTE ⇄ Excel")
 
@@ -393,7 +218,7 @@ if menu == "Converter XTE para Excel e CSV":
     st.subheader("📄➡📊 Transformar arquivos .XTE em Excel e CSV")
     
     st.markdown("""
-    Este modo permite que você envie **dois ou mais arquivos `.xte`** e receba:
+    Este modo permite que você envie **dois ou mais arquivos `.xte`** (soltos ou dentro de arquivos `.zip`) e receba:
 
     - Um **arquivo Excel (.xlsx)** consolidado.
     - Um **arquivo CSV (.csv)** com os mesmos dados.
@@ -401,50 +226,45 @@ if menu == "Converter XTE para Excel e CSV":
     Ideal para visualizar, editar e analisar seus dados fora do sistema.
     """)
 
-    uploaded_files = st.file_uploader("Selecione os arquivos .xte", accept_multiple_files=True, type=["xte"])
+    uploaded_files = st.file_uploader("Selecione os arquivos .xte ou .zip", accept_multiple_files=True, type=["xte", "zip"])
+    validar_envio = esquema_disponivel() and st.checkbox("Validar os arquivos enviados contra o XSD do TISS", value=False)
 
     if uploaded_files:
         st.info(f"Você enviou {len(uploaded_files)} arquivos. Aguarde enquanto processamos.")
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        all_dfs = []
-
-        total = len(uploaded_files)
-        start_time = time.time()
 
-        for i, file in enumerate(uploaded_files):
-            step_start = time.time()
-            with st.spinner(f"Lendo arquivo {file.name}..."):
-                df, _, _ = parse_xte(file)
-                df['Nome da Origem'] = file.name
-                all_dfs.append(df)
-
-            elapsed = time.time() - start_time
-            avg_time = elapsed / (i + 1)
-            est_remaining = avg_time * (total - (i + 1))
-
-            percent_complete = (i + 1) / total
-            progress_bar.progress(percent_complete)
-
-            status_text.markdown(
-                f"Processado {i + 1} de {total} arquivos ({percent_complete:.0%})  \
-                Estimado restante: {int(est_remaining)} segundos 🕒"
-            )
-
-        final_df = pd.concat(all_dfs, ignore_index=True)
-        st.success(f"✅ Processamento concluído: {len(final_df)} registros.")
-
-        st.subheader("🔍 Pré-visualização dos dados:")
-        st.dataframe(final_df.head(20))
-
-        excel_buffer = io.BytesIO()
-        final_df.to_excel(excel_buffer, index=False)
-
-        csv_buffer = io.StringIO()
-        final_df.to_csv(csv_buffer, index=False, sep=";", encoding="utf-8", float_format='%.2f')
+        # A leitura roda na fila em segundo plano, identificada pelo conteúdo enviado: reruns
+        # (ex.: clique em um botão de download) e outras sessões com os mesmos arquivos reaproveitam o resultado
+        chave_envio = hash_do_envio("xte", uploaded_files, validar_envio)
+        tarefa = fila_de_tarefas().obter_ou_iniciar(chave_envio, consolidar_xtes, uploaded_files, validar_envio)
+        resultado = acompanhar_tarefa(tarefa, "Processado")
+        linhas = resultado["linhas"]
+        exportacoes = resultado["exportacoes"]
+        falhas = resultado["falhas"]
+        erros_xsd = resultado["erros_xsd"]
+
+        st.success(f"✅ Processamento concluído: {linhas} registros.")
+        if falhas:
+            st.warning(f"{len(falhas)} arquivo(s) não puderam ser lidos e ficaram de fora:")
+            st.dataframe(pd.DataFrame(falhas, columns=["Arquivo", "Erro"]), hide_index=True)
+        if validar_envio:
+            mostrar_erros_xsd(erros_xsd)
+        if linhas >= LIMITE_LINHAS_EXCEL:
+            st.warning("O Excel consolidado foi dividido em várias planilhas por ultrapassar o limite de linhas do Excel.")
+
+        mostrar_consulta(resultado["consulta"])
+
+        rotulos = {
+            "xlsx": "⬇ Baixar Excel Consolidado",
+            "csv": "⬇ Baixar CSV Consolidado",
+            "parquet": "⬇ Baixar Parquet Consolidado",
+            "arrow": "⬇ Baixar Arrow (IPC) Consolidado",
+        }
+        for formato, caminho in exportacoes.items():
+            with open(caminho, "rb") as arquivo:
+                st.download_button(rotulos[formato], data=arquivo, file_name=NOMES_ARQUIVOS[formato], mime=MIMES[formato])
 
-        st.download_button("⬇ Baixar Excel Consolidado", data=excel_buffer.getvalue(), file_name="dados_consolidados.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        st.download_button("⬇ Baixar CSV Consolidado", data=csv_buffer.getvalue(), file_name="dados_consolidados.csv", mime="text/csv")
+        if exibir_diagnostico:
+            mostrar_diagnostico(tarefa.registros)
 
 elif menu == "Converter Excel para XTE/XML":
     st.subheader("📊➡📄 Transformar Excel em arquivos .XTE/XML")
@@ -466,17 +286,17 @@ elif menu == "Converter Excel para XTE/XML":
         st.info("🔄 Processando o arquivo...")
 
         try:
-            with st.spinner("Gerando arquivos..."):
-                updated_files = gerar_xte_do_excel(excel_file)
+            # Gera direto nos ZIPs em disco, em segundo plano; reruns (cliques nos botões) e
+            # outras sessões com a mesma planilha reaproveitam o resultado
+            tarefa = fila_de_tarefas().obter_ou_iniciar(hash_do_envio("planilha", [excel_file]), gerar_xtes, excel_file)
+            resultado = acompanhar_tarefa(tarefa, "📄 Gerado e compactado")
 
-            # Separar XMLs e XTEs
-            xml_files = {k: v for k, v in updated_files.items() if k.endswith(".xml")}
-            xte_files = {k.replace(".xml", ".xte"): v for k, v in updated_files.items() if k.endswith(".xml")}
+            zips = resultado["zips"]
+            nomes = resultado["nomes"]
+            first_file = resultado["exemplo"]
+            first_key = f"{nomes[0]}.xml"
 
             # Exemplo de preview
-            first_key = next(iter(xml_files))
-            first_file = xml_files[first_key]
-
             st.download_button(
                 f"⬇ Baixar exemplo: {first_key}",
                 data=first_file,
@@ -491,57 +311,36 @@ elif menu == "Converter Excel para XTE/XML":
                 mime="application/xml"
             )
 
-            # Compactar XMLs automaticamente
-            st.info("📦 Compactando arquivos XML...")
-            xml_zip_buffer = io.BytesIO()
-            start_time = time.time()
-            progress = st.progress(0)
-            status = st.empty()
-            total = len(xml_files)
-
-            with zipfile.ZipFile(xml_zip_buffer, "w") as zipf:
-                for i, (filename, content) in enumerate(xml_files.items()):
-                    zipf.writestr(filename, content)
-                    elapsed = time.time() - start_time
-                    avg = elapsed / (i + 1)
-                    remaining = avg * (total - (i + 1))
-                    progress.progress((i + 1) / total)
-                    status.markdown(f"📄 Adicionando {i + 1}/{total} arquivos XML - ⏳ Restante: {int(remaining)}s")
-
-            st.success("✅ Arquivo ZIP com XMLs pronto!")
-            st.download_button(
-                "⬇ Baixar ZIP de XMLs",
-                data=xml_zip_buffer.getvalue(),
-                file_name="arquivos_xml.zip",
-                mime="application/zip"
-            )
-
-            # Botão para gerar e baixar XTEs
-            if st.button("📁 Gerar e Baixar Arquivo ZIP com XTEs"):
-                st.info("📦 Compactando arquivos XTE...")
-                xte_zip_buffer = io.BytesIO()
-                start_time = time.time()
-                progress_xte = st.progress(0)
-                status_xte = st.empty()
-                total_xte = len(xte_files)
-
-                with zipfile.ZipFile(xte_zip_buffer, "w") as zipf:
-                    for i, (filename, content) in enumerate(xte_files.items()):
-                        zipf.writestr(filename, content)
-                        elapsed = time.time() - start_time
-                        avg = elapsed / (i + 1)
-                        remaining = avg * (total_xte - (i + 1))
-                        progress_xte.progress((i + 1) / total_xte)
-                        status_xte.markdown(f"📄 Adicionando {i + 1}/{total_xte} arquivos XTE - ⏳ Restante: {int(remaining)}s")
+            leitura = resultado["leitura"]
+            mostrar_problemas_planilha(leitura["problemas"], leitura["total"])
+            if resultado["erros_xsd"] is not None:
+                mostrar_erros_xsd(resultado["erros_xsd"])
+            else:
+                st.caption("Validação pelo XSD desativada: schema do TISS não encontrado (veja amconsultoria/xsd/ ou XTE_XSD).")
 
-                st.success("✅ Arquivo ZIP com XTEs pronto!")
+            st.success(f"✅ Arquivo ZIP com {len(nomes)} XMLs pronto!")
+            with open(zips[".xml"], "rb") as arquivo:
                 st.download_button(
-                    "⬇ Baixar ZIP de XTEs",
-                    data=xte_zip_buffer.getvalue(),
-                    file_name="arquivos_xte.zip",
+                    "⬇ Baixar ZIP de XMLs",
+                    data=arquivo,
+                    file_name="arquivos_xml.zip",
                     mime="application/zip"
                 )
 
+            # Botão para baixar XTEs (mesmos documentos, já compactados na geração)
+            if st.button("📁 Gerar e Baixar Arquivo ZIP com XTEs"):
+                st.success("✅ Arquivo ZIP com XTEs pronto!")
+                with open(zips[".xte"], "rb") as arquivo:
+                    st.download_button(
+                        "⬇ Baixar ZIP de XTEs",
+                        data=arquivo,
+                        file_name="arquivos_xte.zip",
+                        mime="application/zip"
+                    )
+
+            if exibir_diagnostico:
+                mostrar_diagnostico(tarefa.registros)
+
         except Exception as e:
             st.error(f"Erro durante o processamento: {str(e)}")
             st.error("Verifique se o arquivo Excel possui a estrutura correta.")
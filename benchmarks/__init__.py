@@ -0,0 +1 @@
+"""Benchmarks reprodutíveis da conversão XTE ⇄ Excel (rodam offline, com dados sintéticos)."""
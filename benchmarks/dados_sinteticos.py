@@ -0,0 +1,162 @@
+"""Gerador de dados TISS de monitoramento sintéticos para os benchmarks.
+
+Monta uma planilha no layout de entrada do gerador (uma linha por procedimento) e,
+a partir dela, os documentos `mensagemEnvioANS` (.xte) de cada origem. Tudo é
+derivado de uma semente fixa, então a mesma configuração produz os mesmos arquivos.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from amconsultoria.gerador_xte import GeracaoXTE, nome_arquivo_saida
+
+# Data/hora fixa dos XTE gerados, para os arquivos não mudarem entre execuções
+AGORA_FIXO = pytz.timezone("America/Sao_Paulo").localize(datetime(2024, 5, 6, 7, 8, 9))
+
+# Campos opcionais da guia: entram em uma fração das guias controlada por `opcionais`
+CAMPOS_OPCIONAIS_GUIA = {
+    "guiaSolicitacaoInternacao": "digitos",
+    "dataSolicitacao": "data",
+    "numeroGuiaSPSADTPrincipal": "digitos",
+    "dataAutorizacao": "data",
+    "dataInicialFaturamento": "data",
+    "dataFimPeriodo": "data",
+    "dataPagamento": "data",
+    "tipoConsulta": ("1", "2", "3", "4"),
+    "cboExecutante": ("225125", "225142", "223505"),
+    "indicacaoRecemNato": ("N", "S"),
+    "indicacaoAcidente": ("0", "1", "2", "9"),
+    "tipoInternacao": ("1", "2", "3"),
+    "regimeInternacao": ("1", "2", "3"),
+    "diagnosticoCID": ("J189", "I10", "E119", "K359", "O800"),
+    "tipoAtendimento": ("04", "05", "13", "23"),
+    "regimeAtendimento": ("01", "02", "03"),
+    "tipoFaturamento": ("1", "2", "3", "4"),
+    "diariasAcompanhante": ("0", "1", "2"),
+    "diariasUTI": ("0", "1", "3"),
+    "motivoSaida": ("11", "12", "41"),
+    "formaRemuneracao": ("1", "2", "3"),
+    "valorRemuneracao": "valor",
+    "declaracaoNascido": "digitos",
+    "declaracaoObito": "digitos",
+}
+CAMPOS_OPCIONAIS_PROCEDIMENTO = {
+    "unidadeMedida": ("036", "001", "010"),
+    "valorCoParticipacao": "valor",
+}
+
+
+def _digitos(rng, n, tamanho):
+    return [f"{v:0{tamanho}d}" for v in rng.integers(0, 10 ** min(tamanho, 18), size=n)]
+
+
+def _datas(rng, n, inicio="2023-01-01", dias=730):
+    base = np.datetime64(inicio) + rng.integers(0, dias, size=n).astype("timedelta64[D]")
+    return pd.to_datetime(base).strftime("%d/%m/%Y").tolist()
+
+
+def _valores(rng, n, maximo=5000):
+    return [f"{v:.2f}" for v in rng.uniform(1, maximo, size=n)]
+
+
+def _valores_de(rng, n, tipo):
+    if tipo == "digitos":
+        return _digitos(rng, n, 12)
+    if tipo == "data":
+        return _datas(rng, n)
+    if tipo == "valor":
+        return _valores(rng, n)
+    return rng.choice(tipo, size=n).tolist()
+
+
+def gerar_planilha(guias=1000, procedimentos_por_guia=3, opcionais=0.5, origens=4, semente=42):
+    """Planilha sintética (dtype str) no layout lido por `gerar_xte_do_excel`.
+
+    `procedimentos_por_guia` é o máximo por guia (cada guia recebe de 1 até esse
+    número) e `opcionais` é a fração de guias com cada campo opcional preenchido.
+    """
+    rng = np.random.default_rng(semente)
+    quantidades = rng.integers(1, procedimentos_por_guia + 1, size=guias)
+    linhas = int(quantidades.sum())
+    da_guia = np.repeat(np.arange(guias), quantidades)
+
+    por_guia = {
+        "Nome da Origem": [f"sintetico_{i % origens:03d}.xte" for i in range(guias)],
+        "competenciaLote": rng.choice(["202403", "202404", "202405"], size=guias).tolist(),
+        "registroANS_cabecalho": ["123456"] * guias,
+        "versaoPadrao_cabecalho": ["1.04.01"] * guias,
+        "tipoRegistro": ["1"] * guias,
+        "versaoTISSPrestador": ["4.01.00"] * guias,
+        "formaEnvio": ["1"] * guias,
+        "CNES": _digitos(rng, guias, 7),
+        "identificadorExecutante": ["1"] * guias,
+        "codigoCNPJ_CPF": _digitos(rng, guias, 14),
+        "municipioExecutante": rng.choice(["355030", "330455", "310620"], size=guias).tolist(),
+        "numeroCartaoNacionalSaude": _digitos(rng, guias, 15),
+        "cpfBeneficiario": _digitos(rng, guias, 11),
+        "sexo": rng.choice(["1", "3"], size=guias).tolist(),
+        "dataNascimento": _datas(rng, guias, inicio="1940-01-01", dias=30000),
+        "municipioResidencia": rng.choice(["355030", "330455", "310620"], size=guias).tolist(),
+        "numeroRegistroPlano": _digitos(rng, guias, 9),
+        "tipoEventoAtencao": rng.choice(["1", "2", "3", "4", "5"], size=guias).tolist(),
+        "origemEventoAtencao": rng.choice(["1", "2", "3", "4"], size=guias).tolist(),
+        "numeroGuia_prestador": [f"{100000000 + i}" for i in range(guias)],
+        "numeroGuia_operadora": [f"{900000000 + i}" for i in range(guias)],
+        "identificacaoReembolso": _digitos(rng, guias, 20),
+        "dataRealizacao": _datas(rng, guias),
+        "dataProtocoloCobranca": _datas(rng, guias),
+        "dataProcessamentoGuia": _datas(rng, guias),
+        "caraterAtendimento": rng.choice(["1", "2"], size=guias).tolist(),
+    }
+    for coluna in ("valorTotalInformado", "valorProcessado", "valorTotalPagoProcedimentos", "valorTotalDiarias",
+                   "valorTotalTaxas", "valorTotalMateriais", "valorTotalOPME", "valorTotalMedicamentos",
+                   "valorGlosaGuia", "valorPagoGuia", "valorPagoFornecedores", "valorTotalTabelaPropria",
+                   "valorTotalCoParticipacao"):
+        por_guia[coluna] = _valores(rng, guias)
+    for coluna, tipo in CAMPOS_OPCIONAIS_GUIA.items():
+        valores = np.array(_valores_de(rng, guias, tipo), dtype=object)
+        valores[rng.random(guias) >= opcionais] = None
+        por_guia[coluna] = valores
+
+    df = pd.DataFrame({coluna: np.asarray(valores, dtype=object)[da_guia] for coluna, valores in por_guia.items()})
+
+    df["codigoTabela"] = rng.choice(["22", "19", "20", "98"], size=linhas)
+    df["codigoProcedimento"] = _digitos(rng, linhas, 8)
+    df["quantidadeInformada"] = [f"{v:.2f}" for v in rng.integers(1, 5, size=linhas)]
+    df["valorInformado_proc"] = _valores(rng, linhas, 800)
+    df["quantidadePaga"] = df["quantidadeInformada"]
+    df["valorPagoProc"] = _valores(rng, linhas, 800)
+    df["valorPagoFornecedor_proc"] = _valores(rng, linhas, 100)
+    for coluna, tipo in CAMPOS_OPCIONAIS_PROCEDIMENTO.items():
+        valores = np.array(_valores_de(rng, linhas, tipo), dtype=object)
+        valores[rng.random(linhas) >= opcionais] = None
+        df[coluna] = valores
+    return df
+
+
+def gravar_entradas(df, diretorio, excel=True):
+    """Grava a planilha como CSV (;) e, se `excel`, como .xlsx. Devolve {formato: caminho}."""
+    os.makedirs(diretorio, exist_ok=True)
+    caminhos = {"csv": os.path.join(diretorio, "sintetico.csv")}
+    df.to_csv(caminhos["csv"], sep=";", index=False)
+    if excel:
+        caminhos["xlsx"] = os.path.join(diretorio, "sintetico.xlsx")
+        df.to_excel(caminhos["xlsx"], index=False, engine="xlsxwriter")
+    return caminhos
+
+
+def gravar_xtes(df, diretorio):
+    """Gera um `mensagemEnvioANS` por origem da planilha. Devolve os caminhos dos .xte."""
+    os.makedirs(diretorio, exist_ok=True)
+    geracao = GeracaoXTE(df, agora=AGORA_FIXO)
+    caminhos = []
+    for nome_arquivo, guias in geracao.blocos:
+        caminho = os.path.join(diretorio, f"{nome_arquivo_saida(nome_arquivo)}.xte")
+        with open(caminho, "wb") as saida:
+            geracao.escrever(saida, guias)
+        caminhos.append(caminho)
+    return caminhos
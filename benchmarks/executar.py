@@ -0,0 +1,193 @@
+"""Executa os benchmarks e grava os resultados em JSON.
+
+    python -m benchmarks.executar --guias 20000 --procedimentos 3 --saida resultados.json
+
+Cada etapa roda em um processo filho próprio (fork), para que o pico de memória de
+uma não contamine a outra. São medidos o tempo de parede e o crescimento do pico de
+RSS durante a etapa, sem a preparação (o pico é zerado logo antes, ver
+amconsultoria.diagnostico.medir_pico; fica null onde não dá para medir). Com --alocacoes o pico de alocações do Python
+(tracemalloc) também é medido, o que deixa a execução bem mais lenta.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from amconsultoria.diagnostico import medir_pico
+from amconsultoria.processos import contexto_multiprocessing
+
+ETAPAS = ("parse_xte", "consolidacao", "hash", "geracao_csv", "geracao_xlsx", "exportacao_xlsx", "exportacao_csv", "exportacao_zip")
+
+
+def _rss_atual_kb():
+    with open("/proc/self/statm") as f:
+        paginas = int(f.read().split()[1])
+    return paginas * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _consolidado(xtes):
+    from amconsultoria.esquema import concatenar
+    from amconsultoria.ingestao import ler_xtes_em_paralelo
+
+    return concatenar(ler_xtes_em_paralelo(xtes, max_workers=1))
+
+
+def _preparar(etapa, entradas):
+    """Monta o que a etapa precisa antes de começar a medição (ex.: o DataFrame a exportar)."""
+    if etapa.startswith("exportacao_") and etapa != "exportacao_zip":
+        return _consolidado(entradas["xtes"])
+    return None
+
+
+def _executar(etapa, entradas, preparado, diretorio):
+    """Roda a etapa e devolve métricas de volume (linhas, bytes)."""
+    xtes = entradas["xtes"]
+    if etapa == "parse_xte":
+        from amconsultoria.parser_xte import parse_xte
+
+        maior = max(xtes, key=os.path.getsize)
+        with open(maior, "rb") as f:
+            df = parse_xte(f, nome=os.path.basename(maior))
+        return {"linhas": len(df), "bytes_entrada": os.path.getsize(maior)}
+    if etapa == "consolidacao":
+        df = _consolidado(xtes)
+        return {"linhas": len(df), "bytes_entrada": sum(map(os.path.getsize, xtes))}
+    if etapa == "hash":
+        from amconsultoria.hash_xte import verificar_hash_xte
+
+        for caminho in xtes:
+            with open(caminho, "rb") as f:
+                if not verificar_hash_xte(f)[0]:
+                    raise RuntimeError(f"Hash inválido em {caminho}")
+        return {"arquivos": len(xtes), "bytes_entrada": sum(map(os.path.getsize, xtes))}
+    if etapa in ("geracao_csv", "geracao_xlsx"):
+        from amconsultoria.gerador_xte import gerar_xte_do_excel
+
+        planilha = entradas[etapa.split("_")[1]]
+        arquivos = gerar_xte_do_excel(planilha)
+        return {"arquivos": len(arquivos), "bytes_entrada": os.path.getsize(planilha),
+                "bytes_saida": sum(map(len, arquivos.values()))}
+    if etapa == "exportacao_zip":
+        from amconsultoria.gerador_xte import gerar_xte_em_zips
+
+        destinos = {".xml": os.path.join(diretorio, "xml.zip"), ".xte": os.path.join(diretorio, "xte.zip")}
+        nomes, _ = gerar_xte_em_zips(entradas["csv"], destinos)
+        return {"arquivos": len(nomes), "bytes_saida": sum(map(os.path.getsize, destinos.values()))}
+
+    from amconsultoria.esquema import COLUNAS_FINAIS
+    from amconsultoria.exportacao import exportar_consolidado
+
+    formato = etapa.split("_")[1]
+    caminho = exportar_consolidado(preparado, diretorio, formatos=(formato,), colunas=COLUNAS_FINAIS)[formato]
+    return {"linhas": len(preparado), "bytes_saida": os.path.getsize(caminho)}
+
+
+def _medir(etapa, entradas, alocacoes):
+    diretorio = tempfile.mkdtemp(prefix=f"bench_{etapa}_")
+    try:
+        preparado = _preparar(etapa, entradas)
+        rss_inicial = _rss_atual_kb() / 1024
+        if alocacoes:
+            tracemalloc.start()
+        with medir_pico() as pico:
+            inicio = time.perf_counter()
+            volume = _executar(etapa, entradas, preparado, diretorio)
+            segundos = time.perf_counter() - inicio
+        pico_rss_mb = None if pico.mb is None else max(0.0, pico.mb - rss_inicial)
+        resultado = dict(volume, segundos=segundos, pico_rss_mb=pico_rss_mb)
+        if alocacoes:
+            resultado["pico_python_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        return resultado
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def medir_etapa(etapa, entradas, repeticoes=1, alocacoes=False):
+    """Roda a etapa `repeticoes` vezes, cada uma em um processo novo. Fica o menor tempo e o maior pico."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    medicoes = []
+    for _ in range(repeticoes):
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto_multiprocessing()) as executor:
+            medicoes.append(executor.submit(_medir, etapa, entradas, alocacoes).result())
+    resultado = dict(medicoes[0])
+    resultado["segundos"] = min(m["segundos"] for m in medicoes)
+    resultado["pico_rss_mb"] = max((m["pico_rss_mb"] for m in medicoes if m["pico_rss_mb"] is not None), default=None)
+    if alocacoes:
+        resultado["pico_python_mb"] = max(m["pico_python_mb"] for m in medicoes)
+    resultado["etapa"] = etapa
+    return resultado
+
+
+def _versao():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.executar", description=__doc__.splitlines()[0])
+    parser.add_argument("--guias", type=int, default=5000)
+    parser.add_argument("--procedimentos", type=int, default=3, help="máximo de procedimentos por guia")
+    parser.add_argument("--opcionais", type=float, default=0.5, help="fração de guias com cada campo opcional")
+    parser.add_argument("--origens", type=int, default=4, help="quantidade de arquivos .xte")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--alocacoes", action="store_true", help="mede também o pico do tracemalloc (mais lento)")
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help="lista separada por vírgula")
+    parser.add_argument("--dados", help="diretório dos dados sintéticos (padrão: temporário)")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    from benchmarks.dados_sinteticos import gerar_planilha, gravar_entradas, gravar_xtes
+
+    etapas = [e.strip() for e in args.etapas.split(",") if e.strip()]
+    desconhecidas = set(etapas) - set(ETAPAS)
+    if desconhecidas:
+        parser.error(f"etapas desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    diretorio = args.dados or tempfile.mkdtemp(prefix="bench_dados_")
+    try:
+        df = gerar_planilha(args.guias, args.procedimentos, args.opcionais, args.origens, args.semente)
+        entradas = gravar_entradas(df, diretorio, excel="geracao_xlsx" in etapas)
+        entradas["xtes"] = gravar_xtes(df, os.path.join(diretorio, "xte"))
+        linhas_planilha = len(df)
+        del df
+
+        resultados = []
+        for etapa in etapas:
+            print(f"{etapa}...", file=sys.stderr, flush=True)
+            resultados.append(medir_etapa(etapa, entradas, args.repeticoes, args.alocacoes))
+    finally:
+        if not args.dados:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    relatorio = {
+        "versao": _versao(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": dict(vars(args), linhas_planilha=linhas_planilha),
+        "resultados": resultados,
+    }
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Arquivos gerados conferidos byte a byte com XTE de referência.
+
+Os .xte em tests/dados foram gerados a partir de planilha_geracao.csv pelo gerador
+original (ElementTree + minidom), com a data e a hora fixadas em AGORA. Qualquer
+mudança no layout, no escritor XML ou no hash que altere o arquivo enviado à ANS
+faz estes testes falharem; se a mudança for intencional, os arquivos de referência
+precisam ser gerados de novo e revisados.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+from amconsultoria import gerador_xte
+from amconsultoria.gerador_xte import GeracaoXTE, gerar_xte_em_diretorio, gerar_xte_em_zips, ler_planilha_por_origem
+from amconsultoria.hash_xte import verificar_hash_xte
+
+DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+PLANILHA = os.path.join(DADOS, "planilha_geracao.csv")
+AGORA = datetime(2024, 5, 6, 7, 8, 9, tzinfo=pytz.utc).astimezone(pytz.timezone("America/Sao_Paulo"))
+REFERENCIAS = ("3", "orig_1")
+
+
+def _referencia(nome):
+    with open(os.path.join(DADOS, f"{nome}.xte"), "rb") as f:
+        return f.read()
+
+
+class TestGeracaoXTE(unittest.TestCase):
+    def test_documentos_iguais_aos_de_referencia(self):
+        geracao = GeracaoXTE(ler_planilha_por_origem(PLANILHA).dataframe(), agora=AGORA)
+        gerados = {}
+        for nome_arquivo, guias in geracao.blocos:
+            saida = io.BytesIO()
+            geracao.escrever(saida, guias, nome=nome_arquivo)
+            gerados[gerador_xte.nome_arquivo_saida(nome_arquivo)] = saida.getvalue()
+        self.assertEqual(sorted(gerados), list(REFERENCIAS))
+        for nome, documento in gerados.items():
+            self.assertEqual(documento, _referencia(nome), nome)
+            self.assertTrue(verificar_hash_xte(io.BytesIO(documento))[0], nome)
+
+    def test_diretorio_e_zips(self):
+        with tempfile.TemporaryDirectory() as diretorio, \
+                mock.patch.object(gerador_xte, "agora_no_fuso", return_value=AGORA):
+            caminhos = gerar_xte_em_diretorio(PLANILHA, os.path.join(diretorio, "xte"), extensoes=(".xte", ".xml"))
+            self.assertEqual(len(caminhos), 2 * len(REFERENCIAS))
+            for caminho in caminhos:
+                with open(caminho, "rb") as f:
+                    self.assertEqual(f.read(), _referencia(os.path.splitext(os.path.basename(caminho))[0]), caminho)
+
+            for processos in (1, 2):
+                destinos = {".xte": os.path.join(diretorio, f"xte_{processos}.zip")}
+                nomes, _ = gerar_xte_em_zips(PLANILHA, destinos, processos=processos)
+                self.assertEqual(nomes, list(REFERENCIAS))
+                with zipfile.ZipFile(destinos[".xte"]) as zf:
+                    self.assertIsNone(zf.testzip())
+                    for nome in nomes:
+                        self.assertEqual(zf.read(f"{nome}.xte"), _referencia(nome), nome)
+
+
+if __name__ == "__main__":
+    unittest.main()
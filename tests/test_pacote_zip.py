@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from amconsultoria import pacote_zip
+from amconsultoria.pacote_zip import PacoteZip, comprimir
+
+
+class TestPacoteZip(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "saida.zip")
+        self.documentos = {
+            "a.xte": "<ans:mensagem>ção</ans:mensagem>\n".encode("iso-8859-1") * 5000,
+            "b.xml": b"",
+            "pasta/ç.xte": os.urandom(3000),
+        }
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def _gravar(self):
+        with PacoteZip(self.caminho) as pacote:
+            for nome, dados in self.documentos.items():
+                pacote.adicionar(nome, *comprimir(dados))
+
+    def _conferir(self):
+        with zipfile.ZipFile(self.caminho) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), list(self.documentos))
+            for nome, dados in self.documentos.items():
+                self.assertEqual(zf.read(nome), dados)
+                self.assertEqual(zf.getinfo(nome).compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_ida_e_volta_pelo_zipfile(self):
+        self._gravar()
+        self._conferir()
+
+    def test_zip64(self):
+        # Limites reduzidos para passar pelos campos e registros ZIP64 sem gerar gigabytes
+        with mock.patch.object(pacote_zip, "LIMITE_ZIP64", 100), mock.patch.object(pacote_zip, "LIMITE_ENTRADAS", 2):
+            self._gravar()
+        self._conferir()
+
+    def test_nome_repetido(self):
+        with PacoteZip(self.caminho) as pacote:
+            pacote.adicionar("a.xte", *comprimir(b"1"))
+            with self.assertRaises(ValueError):
+                pacote.adicionar("a.xte", *comprimir(b"2"))
+        with zipfile.ZipFile(self.caminho) as zf:
+            self.assertEqual(zf.read("a.xte"), b"1")
+
+    def test_adicionar_depois_de_fechar(self):
+        pacote = PacoteZip(self.caminho)
+        pacote.fechar()
+        pacote.fechar()
+        with self.assertRaises(ValueError):
+            pacote.adicionar("a.xte", *comprimir(b"1"))
+        with zipfile.ZipFile(self.caminho) as zf:
+            self.assertEqual(zf.namelist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()